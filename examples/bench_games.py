@@ -0,0 +1,30 @@
+import sys
+sys.path.append('..')
+import multiprocessing
+from timeit import default_timer
+from nflparser import GameFactory, BasicPlayMaker
+
+def bench_games(csvfile, worker_counts=(1, 2, 4), repeats=3):
+    """Times building every game in csvfile with GameFactory, for each
+    number of workers, and prints the best of repeats runs."""
+    print '%s, %d CPUs' % (csvfile, multiprocessing.cpu_count())
+    baseline = None
+    for workers in worker_counts:
+        best = None
+        for _ in range(repeats):
+            start = default_timer()
+            games = GameFactory(csvfile, BasicPlayMaker(),
+                                workers=workers).make_games()
+            elapsed = default_timer() - start
+            best = elapsed if best is None else min(best, elapsed)
+        if baseline is None:
+            baseline = best
+        print '%2d workers: %d games in %.2fs (%.2fx)' % (
+            workers, len(games), best, baseline / best)
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print 'usage: python bench_games.py <season csv> [workers ...]'
+        sys.exit(1)
+    counts = tuple(int(w) for w in sys.argv[2:]) or (1, 2, 4)
+    bench_games(sys.argv[1], counts)
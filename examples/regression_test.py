@@ -0,0 +1,465 @@
+import sys
+sys.path.append('..')
+import os
+import shutil
+import tempfile
+import cPickle
+from csv import DictReader
+from nflparser import (get_play_parser, parse_plays, iter_parse,
+                       parse_to_csv, parse_file_to_csv, ColumnarPlays,
+                       ParseCache, ShapeTemplates, BasicPlayMaker,
+                       Game, GameFactory, IncrementalGameFactory,
+                       SeasonStore, PlayQuery, Play, iter_rows,
+                       load_name_exceptions)
+from nflparser.parser_types import NOT_SET
+from nflparser.parser_frontend import parse_play
+
+def _descriptions():
+    with open('test_descriptions.txt') as fsock:
+        plays = fsock.read().split('\n')
+    with open('test_games.csv') as fsock:
+        plays.extend(row['description'] for row in DictReader(fsock))
+    return plays
+
+def _play_key(play):
+    return (play.is_error, play.clockmin, play.clocksec, str(play))
+
+def _game_key(game):
+    return (game.date, game.home, game.away, game.home_points,
+            game.away_points, game.winner, map(repr, game.plays))
+
+def check_name_exceptions():
+    """Names from an exception file are recognized once it is loaded,
+    and parses cached before that are not reused.  Loading changes
+    the parser for the rest of the process, so this runs last."""
+    print 'check_name_exceptions()'
+    parser = get_play_parser()
+    description = ('(14:25) Z.Van Der Berg pass incomplete to J.Shockey '
+                   '(D.Smith).')
+    cache = ParseCache()
+    before = parse_play(description, parser, cache=cache)
+    assert before.segments[0].primary_name == 'Z.Van_Der_Berg'
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, 'names.txt')
+        with open(filename, 'w') as fsock:
+            fsock.write('# written\tcode\nZ.Van Der Berg\tZ.VanDerBerg\n')
+        load_name_exceptions(filename)
+    finally:
+        shutil.rmtree(tmpdir)
+    after = parse_play(description, parser)
+    assert after.segments[0].primary_name == 'Z.VanDerBerg'
+    assert after.segments[0].pass_target == 'J.Shockey'
+    cached = parse_play(description, parser, cache=cache)
+    assert cached.segments[0].primary_name == 'Z.VanDerBerg'
+
+def check_kick_yardage():
+    """Kick and punt yardages must be found when the 'yards' token
+    has something glued to it."""
+    print 'check_kick_yardage()'
+    parser = get_play_parser()
+    cases = [('J.Cortez kicks 74 yards; from CLV 30 to NYG -4. '
+              'R.Dixon  Touchback.', 'KICKOFF', 74),
+             ('B.Maynard punts 44 yards, to SF 38, Center-J.Jones. '
+              'fair catch by J.Swift.', 'PUNT', 44),
+             ('J.Cortez kicks 57 yardsline from SF 30 to NYG 13. '
+              'R.Dixon to NYG 30 for 17 yards (J.Webster).', 'KICKOFF', 57),
+             ('J.Cortez kicks 75 yards from SF 30 to NYG -5. '
+              'R.Dixon  Touchback.', 'KICKOFF', 75)]
+    for description, kick_type, yardage in cases:
+        parsed = parse_play(description, parser)
+        assert not parsed.is_error, description
+        segment = parsed.segments[0]
+        assert segment.type == kick_type, description
+        assert segment.yardage == yardage, description
+
+def check_columnar():
+    """ColumnarPlays hold the same plays as parse_plays, and survive
+    a save and load."""
+    print 'check_columnar()'
+    plays = _descriptions()
+    expected = map(_play_key, parse_plays(plays))
+    table = parse_plays(plays, columnar=True)
+    assert map(_play_key, table.to_plays()) == expected
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, 'plays.npz')
+        table.save(filename)
+        loaded = ColumnarPlays.load(filename)
+        assert map(_play_key, loaded.to_plays()) == expected
+    finally:
+        shutil.rmtree(tmpdir)
+
+def check_cache():
+    """Results from a ParseCache file, read back by a new cache, match
+    fresh parses."""
+    print 'check_cache()'
+    plays = _descriptions()
+    expected = map(_play_key, parse_plays(plays))
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, 'cache')
+        with ParseCache(filename=filename) as cache:
+            parse_plays(plays, cache=cache)
+        with ParseCache(filename=filename) as cache:
+            cached = parse_plays(plays, cache=cache)
+            assert cache.disk_hits > 0 and cache.misses == 0
+        assert map(_play_key, cached) == expected
+    finally:
+        shutil.rmtree(tmpdir)
+
+def check_shapes():
+    """Parsing through ShapeTemplates, verified against the FSM, gives
+    the same plays as parsing directly."""
+    print 'check_shapes()'
+    plays = _descriptions()
+    expected = map(_play_key, parse_plays(plays))
+    shapes = ShapeTemplates(verify=True)
+    for rerun in range(2):
+        parsed = parse_plays(plays, shapes=shapes)
+        assert map(_play_key, parsed) == expected
+    assert shapes.mismatches == 0, shapes.mismatch_examples
+
+def check_parse_workers():
+    """parse_plays gives the same results, in the same order, with
+    workers as without, with or without a cache."""
+    print 'check_parse_workers()'
+    plays = _descriptions()
+    expected = map(_play_key, parse_plays(plays))
+    for workers, chunksize in ((2, 50), (3, None)):
+        parsed = parse_plays(plays, workers=workers, chunksize=chunksize)
+        assert map(_play_key, parsed) == expected
+    cache = ParseCache()
+    for rerun in range(2):
+        parsed = parse_plays(plays, cache=cache, workers=2, chunksize=50)
+        assert map(_play_key, parsed) == expected
+    assert cache.hits > 0
+
+def check_streaming():
+    """iter_parse reads descriptions as it goes and gives the results
+    of parse_plays; parse_to_csv and parse_file_to_csv write the same
+    file."""
+    print 'check_streaming()'
+    plays = [p for p in _descriptions() if p]
+    expected = map(_play_key, parse_plays(plays))
+    read = []
+    def reading():
+        for play in plays:
+            read.append(play)
+            yield play
+    results = iter_parse(reading())
+    first = next(results)
+    assert len(read) == 1
+    assert map(_play_key, [first] + list(results)) == expected
+    parsed = iter_parse(iter(plays), workers=2, chunksize=50)
+    assert map(_play_key, parsed) == expected
+    tmpdir = tempfile.mkdtemp()
+    try:
+        infile = os.path.join(tmpdir, 'plays.txt')
+        with open(infile, 'w') as fsock:
+            fsock.write('\n'.join(plays) + '\n\n')
+        outputs = [os.path.join(tmpdir, name) for name in ('a', 'b', 'c')]
+        parse_to_csv(iter(plays), outputs[0])
+        parse_file_to_csv(infile, outputs[1])
+        parse_file_to_csv(infile, outputs[2], workers=2, chunksize=50)
+        with open(outputs[0]) as fsock:
+            written = fsock.read()
+        for output in outputs[1:]:
+            with open(output) as fsock:
+                assert fsock.read() == written
+        lines = written.splitlines()[1:]
+        segments = sum(len(p.segments) for p in parse_plays(plays))
+        assert len(lines) == segments
+        assert [line.rsplit(';', 1)[1] for line in lines
+                if line.split(';')[1] == '1'] == \
+            [p for p, parsed in zip(plays, parse_plays(plays))
+             if parsed.segments]
+    finally:
+        shutil.rmtree(tmpdir)
+
+def check_dedup():
+    """parse_plays(dedup=True) gives the results of parse_plays, as
+    copies unless share=True."""
+    print 'check_dedup()'
+    plays = _descriptions() * 3
+    expected = map(_play_key, parse_plays(plays))
+    parsed = parse_plays(plays, dedup=True)
+    assert map(_play_key, parsed) == expected
+    n = len(plays) // 3
+    assert parsed[0] is not parsed[n]
+    parsed[0].is_error = not parsed[0].is_error
+    assert parsed[n].is_error != parsed[0].is_error
+    shared = parse_plays(plays, dedup=True, share=True)
+    assert map(_play_key, shared) == expected
+    assert shared[0] is shared[n]
+    parsed = parse_plays(plays, dedup=True, workers=2, chunksize=50)
+    assert map(_play_key, parsed) == expected
+
+def check_game_workers():
+    """GameFactory gives the same games, in the same order, with
+    workers as without.  Copies of a PlayMaker made for workers have
+    its ParseCache's table but leave its file alone."""
+    print 'check_game_workers()'
+    expected = GameFactory('test_games.csv', BasicPlayMaker()).make_games()
+    for workers in (2, 3):
+        games = GameFactory('test_games.csv', BasicPlayMaker(),
+                            workers=workers).make_games()
+        assert map(_game_key, games) == map(_game_key, expected)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, 'cache')
+        with ParseCache(filename=filename) as cache:
+            playmaker = BasicPlayMaker(cache=cache)
+            GameFactory('test_games.csv', playmaker).make_games()
+            copy = cPickle.loads(cPickle.dumps(playmaker, 2))
+            assert len(copy.cache) == len(cache)
+            counts = (copy.cache.misses, copy.cache.disk_hits)
+            games = GameFactory('test_games.csv', copy).make_games()
+            assert map(_game_key, games) == map(_game_key, expected)
+            assert (copy.cache.misses, copy.cache.disk_hits) == counts
+        with ParseCache(filename=filename) as cache:
+            GameFactory('test_games.csv', BasicPlayMaker(cache=cache)
+                        ).make_games()
+            assert cache.misses == 0 and cache.disk_hits > 0
+    finally:
+        shutil.rmtree(tmpdir)
+
+def check_blank_rows():
+    """Blank lines in a season file, between games or at the end, are
+    skipped."""
+    print 'check_blank_rows()'
+    expected = GameFactory('test_games.csv', BasicPlayMaker()).make_games()
+    tmpdir = tempfile.mkdtemp()
+    try:
+        csvfile = os.path.join(tmpdir, 'games.csv')
+        with open('test_games.csv', 'rb') as fsock:
+            lines = fsock.readlines()
+        split = next(i for i, line in enumerate(lines)
+                     if line.startswith('20020908'))
+        lines = lines[:split] + ['\r\n'] + lines[split:] + ['\r\n']
+        with open(csvfile, 'wb') as fsock:
+            fsock.writelines(lines)
+        factory = GameFactory(csvfile, BasicPlayMaker())
+        games = factory.make_games()
+        assert map(_game_key, games) == map(_game_key, expected)
+        assert list(factory.index) == ['20020905_SF@NYG', '20020908_KC@CLE']
+        assert _game_key(factory.get_game('20020908_KC@CLE')) == \
+            _game_key(expected[1])
+    finally:
+        shutil.rmtree(tmpdir)
+
+def check_make_play_rows():
+    """make_play gives the same plays for csv.DictReader rows as for
+    iter_rows rows, and copes with blank fields in either."""
+    print 'check_make_play_rows()'
+    playmaker = BasicPlayMaker()
+    with open('test_games.csv') as fsock:
+        raw_rows = list(DictReader(fsock))
+    with open('test_games.csv', 'rb') as fsock:
+        typed_rows = list(iter_rows(fsock))
+    for raw, typed in zip(raw_rows, typed_rows):
+        game = Game(game_id=raw['gameid'])
+        assert (repr(playmaker.make_play(game.home, game.away, raw)) ==
+                repr(playmaker.make_play(game.home, game.away, typed)))
+    blank = dict(raw_rows[1], down='', min='', ydline='')
+    play = playmaker.make_play('NYG', 'SF', blank)
+    assert play.down == 0 and play.type == 'NA'
+
+class _NotedPlay(Play):
+    __slots__ = ('note', 'words')
+
+class _NotingPlayMaker(BasicPlayMaker):
+    play_class = _NotedPlay
+
+    def transform(self, play, description):
+        play = BasicPlayMaker.transform(self, play, description)
+        if play.type is not NOT_SET:
+            play.note = play.type.lower()
+        play.words = len(description.split())
+        return play
+
+def check_store():
+    """A SeasonStore holds the games, plays and parsed segments that
+    GameFactory builds from the same csv."""
+    print 'check_store()'
+    games = GameFactory('test_games.csv', BasicPlayMaker()).make_games()
+    parsed = parse_plays([row['description'] for row in
+                          DictReader(open('test_games.csv'))])
+    tmpdir = tempfile.mkdtemp()
+    try:
+        store = SeasonStore.write(os.path.join(tmpdir, 'store'),
+                                  'test_games.csv', BasicPlayMaker())
+        assert len(store) == len(games)
+        views = [view for game in store for view in game.plays]
+        for game, view in zip(games, store):
+            assert (game.date, game.home, game.away) == \
+                (view.date, view.home, view.away)
+            assert (game.home_points, game.away_points, game.winner) == \
+                (view.home_points, view.away_points, view.winner)
+            assert map(repr, game.plays) == map(repr, view.plays)
+        assert len(views) == len(parsed)
+        for play, view in zip(parsed, views):
+            assert play.is_error == view.is_error
+            assert map(repr, play.segments) == map(repr, view.segments)
+        # fields added by a play_class are stored too
+        games = GameFactory('test_games.csv', _NotingPlayMaker()).make_games()
+        store = SeasonStore.write(os.path.join(tmpdir, 'noted'),
+                                  'test_games.csv', _NotingPlayMaker())
+        assert store.play_fields[-2:] == ('note', 'words')
+        for game, view in zip(games, store):
+            assert map(repr, game.plays) == map(repr, view.plays)
+    finally:
+        shutil.rmtree(tmpdir)
+
+def check_incremental():
+    """IncrementalGameFactory rebuilds just the edited game after an
+    edit, everything after a change of Play fields (even when the
+    stored plays no longer load), and gives the same games as
+    GameFactory."""
+    print 'check_incremental()'
+    tmpdir = tempfile.mkdtemp()
+    try:
+        csvfile = os.path.join(tmpdir, 'games.csv')
+        shelf = os.path.join(tmpdir, 'games')
+        shutil.copy('test_games.csv', csvfile)
+        factory = IncrementalGameFactory(csvfile, BasicPlayMaker(), shelf)
+        factory.make_games()
+        assert len(factory.new) == 2 and not factory.reused
+        with open(csvfile, 'rb') as fsock:
+            lines = fsock.readlines()
+        lines[1] = lines[1].replace('kicks 75 yards', 'kicks 71 yards')
+        with open(csvfile, 'wb') as fsock:
+            fsock.writelines(lines)
+        factory = IncrementalGameFactory(csvfile, BasicPlayMaker(), shelf)
+        games = factory.make_games()
+        report = factory.report()
+        assert len(report['reused']) == 1 and len(report['rebuilt']) == 1
+        expected = GameFactory(csvfile, BasicPlayMaker()).make_games()
+        assert map(_game_key, games) == map(_game_key, expected)
+        playmaker = BasicPlayMaker()
+        playmaker.play_class = _NotedPlay
+        factory = IncrementalGameFactory(csvfile, playmaker, shelf)
+        games = factory.make_games()
+        assert len(factory.rebuilt) == 2 and not factory.reused
+        assert all(isinstance(play, _NotedPlay)
+                   for game in games for play in game.plays)
+        # stored plays of a class that has since lost a field (as
+        # after an edit to its module) are rebuilt
+        factory = IncrementalGameFactory(csvfile, _NotingPlayMaker(), shelf)
+        factory.make_games()
+        noted_play = _NotedPlay
+        globals()['_NotedPlay'] = type('_NotedPlay', (Play,),
+                                       {'__slots__': ()})
+        try:
+            factory = IncrementalGameFactory(csvfile, BasicPlayMaker(),
+                                             shelf)
+            factory.make_games()
+            assert len(factory.rebuilt) == 2
+        finally:
+            globals()['_NotedPlay'] = noted_play
+    finally:
+        shutil.rmtree(tmpdir)
+
+def check_index():
+    """GameFactory finds games through its GameIndex, kept in a file
+    only when asked, and rebuilt once the season file changes."""
+    print 'check_index()'
+    expected = GameFactory('test_games.csv', BasicPlayMaker()).make_games()
+    tmpdir = tempfile.mkdtemp()
+    try:
+        csvfile = os.path.join(tmpdir, 'games.csv')
+        index_path = os.path.join(tmpdir, 'games.idx')
+        shutil.copy('test_games.csv', csvfile)
+        factory = GameFactory(csvfile, BasicPlayMaker())
+        assert _game_key(factory.get_game('20020908_KC@CLE')) == \
+            _game_key(expected[1])
+        assert os.listdir(tmpdir) == ['games.csv']
+        factory = GameFactory(csvfile, BasicPlayMaker(),
+                              index_path=index_path)
+        assert [_game_key(g) for g in factory.games_for_team('SF')] == \
+            [_game_key(expected[0])]
+        assert os.path.exists(index_path)
+        # change the file: move the first game after the second, with
+        # the date of a later game, and end with a blank line
+        with open(csvfile, 'rb') as fsock:
+            lines = fsock.readlines()
+        split = next(i for i, line in enumerate(lines)
+                     if line.startswith('20020908'))
+        moved = [line.replace('20020905_SF@NYG', '20020915_SF@NYG')
+                 for line in lines[1:split]]
+        with open(csvfile, 'wb') as fsock:
+            fsock.writelines(lines[:1] + lines[split:] + moved + ['\n'])
+        for factory in (factory, GameFactory(csvfile, BasicPlayMaker(),
+                                             index_path=index_path)):
+            assert list(factory.index) == ['20020908_KC@CLE',
+                                           '20020915_SF@NYG']
+            assert factory.games_on(20020905) == []
+            game = factory.get_game('20020915_SF@NYG')
+            assert _game_key(game)[1:] == _game_key(expected[0])[1:]
+    finally:
+        shutil.rmtree(tmpdir)
+
+def check_query():
+    """PlayQuery selects the same plays of a SeasonStore as a loop
+    over its PlayViews."""
+    print 'check_query()'
+    def yards_to_goal(play):
+        if play.yardage_mult == 1:
+            return 100 - play.start_yardline
+        return play.start_yardline
+    queries = [
+        (dict(down=3, togo__ge=7),
+         lambda g, p, s: p.down == 3 and p.togo >= 7),
+        (dict(yards_to_goal__le=30, type='PASS'),
+         lambda g, p, s: p.start_yardline is not NOT_SET and
+                         yards_to_goal(p) <= 30 and s.type == 'PASS'),
+        (dict(offense='NYG', type__in=['RUN', 'PASS']),
+         lambda g, p, s: p.offense == 'NYG' and s.type in ('RUN', 'PASS')),
+        (dict(penalty_team__isset=True, home='NYG'),
+         lambda g, p, s: s.penalty_team is not NOT_SET and g.home == 'NYG'),
+        (dict(pass_complete=False, down__ne=1),
+         lambda g, p, s: s.pass_complete is False and
+                         p.down is not NOT_SET and p.down != 1)]
+    tmpdir = tempfile.mkdtemp()
+    try:
+        store = SeasonStore.write(os.path.join(tmpdir, 'store'),
+                                  'test_games.csv', BasicPlayMaker())
+        views = [(game, view) for game in store for view in game.plays]
+        for predicates, match in queries:
+            expected = [i for i, (game, view) in enumerate(views)
+                        if any(match(game, view, segment)
+                               for segment in view.segments)]
+            assert expected, predicates
+            query = PlayQuery(store).filter(**predicates)
+            assert list(query.indexes()) == expected, predicates
+            assert query.count() == len(expected), predicates
+        # type and end_zone_result are play and segment fields both
+        expected = [i for i, (game, view) in enumerate(views)
+                    if view.type == 'NA']
+        assert expected
+        query = PlayQuery(store).filter(play_type='NA')
+        assert list(query.indexes()) == expected
+        assert list(query.table('play_type')['play_type']) == \
+            ['NA'] * len(expected)
+        assert PlayQuery(store).filter(segment_type='PASS').count() == \
+            PlayQuery(store).filter(type='PASS').count()
+    finally:
+        shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+    check_kick_yardage()
+    check_columnar()
+    check_cache()
+    check_shapes()
+    check_parse_workers()
+    check_game_workers()
+    check_streaming()
+    check_dedup()
+    check_blank_rows()
+    check_make_play_rows()
+    check_store()
+    check_incremental()
+    check_index()
+    check_query()
+    check_name_exceptions()
+    print 'OK'
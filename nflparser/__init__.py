@@ -1,5 +1,16 @@
-from parser_types import ParseError, PlayDescription, PlaySegment
-from parser_frontend import (FSM, lex_play, get_play_parser, 
-                             parse_plays, parse_to_csv)
-from builder import (Season, Play, Game, GameFactory, PlayMaker,
-                     BasicPlayMaker)
+from parser_types import (ParseError, PlayDescription, PlaySegment,
+                          TokenStream, NOT_SET)
+from lexer import lex_play, lex_play_coded, lex_many
+from parser_frontend import (FSM, TracingFSM, get_play_parser, parse_plays,
+                             iter_parse, parse_to_csv, parse_file_to_csv)
+from builder import (Season, Seasons, Play, Game, GameFactory, PlayMaker,
+                     BasicPlayMaker, IncrementalGameFactory, GameIndex,
+                     iter_rows)
+from profiler import ParseProfiler, ErrorSummary
+from parse_states import load_name_exceptions
+from names import NameTrie
+from columnar import ColumnarPlays, ColumnBuilder
+from cache import ParseCache
+from shapes import ShapeTemplates
+from store import SeasonStore, GameView, PlayView
+from query import PlayQuery
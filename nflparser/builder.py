@@ -9,10 +9,20 @@
 #
 ############################################################
 
-from parser_types import PlayDescription
+from parser_types import (ParseError, NOT_SET, _Record, PlaySegment,
+                          PlayDescription)
 from parser_frontend import get_play_parser, parse_play
-from csv import DictReader
-import copy
+from parse_states import parser_version
+from csv import reader
+from timeit import default_timer
+from collections import OrderedDict
+import datetime
+import hashlib
+import json
+import os
+import shelve
+import cPickle
+import multiprocessing
 import numpy as np
 
 # maps team codes used in descriptions to team codes used in
@@ -70,8 +80,189 @@ def _match_teams(team_desc, home, away):
         raise ParseError('unable to match team name: '
                          '%s (%s, %s)' % (team_desc, home, away))
 
+# Weeks of a season run Tuesday through Monday; week 1 is the week
+# holding the first game.
+def _game_day(date):
+    return datetime.date(date // 10000, date // 100 % 100, date % 100)
+
+def _week_start(day):
+    # the Tuesday on or before day (Monday is 0)
+    return day - datetime.timedelta(days=(day.weekday() - 1) % 7)
+
 class Season(object):
-    pass
+    """The games of one season, indexed by week, date and team.
+
+    Weeks are counted from the Tuesday on or before the first game,
+    so playoff games fall in the weeks after the regular season.
+
+    Build one from a season file with Season.load, or add games one
+    at a time with add_game.  load_time holds the seconds spent
+    building the games, for seasons made by load.
+
+    """
+    def __init__(self, year=None, games=()):
+        self.year = year
+        self.games = []
+        self.load_time = None
+        self._anchor = None
+        self._by_week = {}
+        self._by_date = {}
+        self._by_team = {}
+        for game in games:
+            self.add_game(game)
+
+    @classmethod
+    def load(cls, csvfile, playmaker, workers=1):
+        """Build a Season from a season file with a GameFactory."""
+        start = default_timer()
+        games = GameFactory(csvfile, playmaker, workers).make_games()
+        season = cls(games=games)
+        season.load_time = default_timer() - start
+        return season
+
+    def __len__(self):
+        return len(self.games)
+
+    def __iter__(self):
+        return iter(self.games)
+
+    def __repr__(self):
+        return '<Season %s: %d games>' % (self.year, len(self.games))
+
+    def add_game(self, game):
+        day = _game_day(game.date)
+        if self._anchor is None or day < self._anchor:
+            # an earlier first game shifts every week
+            self._anchor = _week_start(day)
+            games = self.games
+            self.games = []
+            self._by_week = {}
+            self._by_date = {}
+            self._by_team = {}
+            for old_game in games:
+                self._index_game(old_game)
+        if self.year is None:
+            self.year = day.year
+        self._index_game(game)
+
+    def _index_game(self, game):
+        self.games.append(game)
+        self._by_week.setdefault(self.week_of(game), []).append(game)
+        self._by_date.setdefault(game.date, []).append(game)
+        self._by_team.setdefault(game.home, []).append(game)
+        self._by_team.setdefault(game.away, []).append(game)
+
+    def week_of(self, game):
+        """Return the week number of game, counting from 1."""
+        return (_game_day(game.date) - self._anchor).days // 7 + 1
+
+    def weeks(self):
+        """Return the sorted week numbers that have games."""
+        return sorted(self._by_week)
+
+    def teams(self):
+        return sorted(self._by_team)
+
+    def select(self, week=None, date=None, team=None):
+        """Return the games matching every criterion given, in the
+        order they were added.  date is an integer YYYYMMDD; team
+        matches either the home or the away team."""
+        if week is not None:
+            games = self._by_week.get(week, [])
+        elif date is not None:
+            games = self._by_date.get(date, [])
+        elif team is not None:
+            games = self._by_team.get(team, [])
+        else:
+            games = self.games
+        return [g for g in games
+                if (week is None or self.week_of(g) == week) and
+                   (date is None or g.date == date) and
+                   (team is None or team in (g.home, g.away))]
+
+class Seasons(object):
+    """A collection of Seasons, keyed by year.
+
+    Seasons.load builds many season files at once, one worker process
+    per file, so loading takes about as long as the slowest file.
+    load_times maps each file to the seconds spent building it.
+
+    """
+    def __init__(self, seasons=()):
+        self._seasons = {}
+        self.load_times = {}
+        for season in seasons:
+            self.add_season(season)
+
+    @classmethod
+    def load(cls, csvfiles, playmaker, workers=None):
+        """Build a Season from each of csvfiles, using up to workers
+        processes (default: one per file, at most one per CPU).
+        Workers use copies of playmaker (see GameFactory)."""
+        csvfiles = list(csvfiles)
+        if workers is None:
+            workers = min(len(csvfiles), multiprocessing.cpu_count())
+        tasks = [(csvfile, playmaker) for csvfile in csvfiles]
+        if workers > 1 and len(csvfiles) > 1:
+            pool = multiprocessing.Pool(workers)
+            try:
+                loaded = pool.map(_load_season, tasks, chunksize=1)
+            finally:
+                pool.terminate()
+                pool.join()
+        else:
+            loaded = map(_load_season, tasks)
+        seasons = cls()
+        for csvfile, season in zip(csvfiles, loaded):
+            seasons.add_season(season)
+            seasons.load_times[csvfile] = season.load_time
+        return seasons
+
+    def add_season(self, season):
+        if season.year in self._seasons:
+            raise ValueError('duplicate season: %s' % season.year)
+        self._seasons[season.year] = season
+
+    def __getitem__(self, year):
+        return self._seasons[year]
+
+    def __contains__(self, year):
+        return year in self._seasons
+
+    def __len__(self):
+        return len(self._seasons)
+
+    def __iter__(self):
+        """Iterate over the seasons, in order of year."""
+        for year in self.years():
+            yield self._seasons[year]
+
+    def years(self):
+        return sorted(self._seasons)
+
+    def games(self, season=None, week=None, date=None, team=None):
+        """Return the games matching every criterion given, by
+        season year and then in file order; see Season.select."""
+        if season is not None:
+            if season not in self._seasons:
+                return []
+            return self._seasons[season].select(week, date, team)
+        result = []
+        for s in self:
+            result.extend(s.select(week, date, team))
+        return result
+
+def _load_season(task):
+    # Runs in worker processes for Seasons.load.
+    csvfile, playmaker = task
+    return Season.load(csvfile, playmaker)
+
+def _parse_game_id(game_id):
+    # format: YYYYMMDD_[AWAY]@[HOME]
+    # returns (date, home, away)
+    date_str, teams = game_id.split('_')
+    away, home = teams.split('@')
+    return int(date_str), home, away
 
 class Game(object):
     """Encapsulates information relating to a game and
@@ -88,11 +279,7 @@ class Game(object):
 
         """
         if game_id is not None:
-            # if given a game id, parse it.
-            # format: YYYYMMDD_[AWAY]@[HOME]
-            date_str, teams = game_id.split('_')
-            away, home = teams.split('@')
-            date = int(date_str)
+            date, home, away = _parse_game_id(game_id)
         self.date = date
         self.home = home
         self.away = away
@@ -114,17 +301,89 @@ class Game(object):
         else:
             self.winner = 'TIE_GAME'
 
-class Play(object):
-    """Simple data container for now.
+class Play(_Record):
+    """One play of a game, as made by a PlayMaker.
+    Has a fixed set of fields; those not set read as NOT_SET.
+    parsed holds the PlayDescription of the play's description when
+    the PlayMaker keeps it (see PlayMaker.keep_parsed).  PlayMakers
+    whose transform sets other fields should use a
+    subclass adding them to __slots__ (see PlayMaker.play_class).
 
     """
+    __slots__ = ('home_points', 'away_points', 'down', 'togo', 'offense',
+                 'time', 'start_yardline', 'yardage_mult', 'type',
+                 'end_zone_result', 'yards', 'parsed')
+    _fields = frozenset(__slots__)
+
     def __init__(self):
         self.home_points = 0
         self.away_points = 0
 
     def __repr__(self):
-        return ';'.join('{0}={1}'.format(k, v)
-                        for k, v in vars(self).iteritems())
+        return str(self)
+
+# season file columns holding integers; empty (or malformed) values
+# are read as None.
+_int_columns = frozenset(['qtr', 'min', 'sec', 'down', 'togo', 'ydline',
+                          'offscore', 'defscore', 'season'])
+
+def _int_or_none(value):
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+def iter_rows(lines, columns=None, fieldnames=None):
+    """Generates a dict for each row of season file csv data.
+
+    Arguments:
+    ----------
+    lines: iterable of csv lines, e.g. an open file.
+    columns: the columns to include in each row (default: all).
+    Integer columns (see _int_columns) hold ints, or None where the
+    file has no value.
+    fieldnames: the names of the columns in the file.  If not given,
+    they are read from the first line.
+    """
+    rows = reader(lines)
+    if fieldnames is None:
+        fieldnames = next(rows)
+    if columns is None:
+        columns = fieldnames
+    columns = tuple(columns)
+    try:
+        index = [fieldnames.index(c) for c in columns]
+    except ValueError:
+        raise ValueError('season file is missing columns: %s' %
+                         ', '.join(c for c in columns if c not in fieldnames))
+    int_positions = [j for j, c in enumerate(columns) if c in _int_columns]
+    for fields in rows:
+        if not fields:
+            # blank line
+            continue
+        values = [fields[i] for i in index]
+        for j in int_positions:
+            value = values[j]
+            if value.isdigit():
+                values[j] = int(value)
+            elif value:
+                values[j] = _int_or_none(value)
+            else:
+                values[j] = None
+        yield dict(zip(columns, values))
+
+def _int_column(rows, name):
+    # Returns an array of the integer column name of rows, with zeros
+    # for missing values, and a boolean array marking those.  Rows
+    # not read by iter_rows (e.g. from csv.DictReader) hold strings,
+    # which are converted here.
+    values = [row[name] for row in rows]
+    values = [_int_or_none(v) if isinstance(v, basestring) else v
+              for v in values]
+    missing = np.array([v is None for v in values], dtype=bool)
+    if missing.any():
+        values = [0 if v is None else v for v in values]
+    return np.array(values, dtype=np.int64), missing
 
 class GameFactory(object):
     """Initialized with a csv file of raw data and an instance
@@ -132,32 +391,424 @@ class GameFactory(object):
 
     The iter_games method generates an season of games.
 
+    Rows are read with iter_rows, limited to the playmaker's columns.
+
+    With workers > 1, games are built by that many processes (at
+    most one per CPU), each handling ranges of the file that start and
+    end at game boundaries, with its own copy of the PlayMaker (whose
+    ParseCache, if any, does not use the cache's file).  Games
+    are still generated in file order.  The file must hold one play
+    per line.  Whether this is faster depends on the machine: the
+    games are pickled back to this process.  Measure with
+    examples/bench_games.py before relying on it.
+
+    get_game, games_for_team and games_on build only the games asked
+    for, seeking to them through the file's GameIndex.  The index is
+    built in memory, or kept in the file index_path if one is given
+    (see GameIndex.load).
+
     """
-    def __init__(self, csvfile, playmaker):
+    def __init__(self, csvfile, playmaker, workers=1, index_path=None):
         self._csvfile = csvfile
         self._playmaker = playmaker
+        self.workers = workers
+        self.index_path = index_path
+        self._index = None
+        self.columns = tuple(playmaker.columns)
+        if 'gameid' not in self.columns:
+            self.columns = ('gameid',) + self.columns
         
     def make_games(self):
         return list(self.iter_games())
 
     def iter_games(self):
-        with open(self._csvfile) as fhandle:
-            reader = DictReader(fhandle)
-            current_game_id = ''
-            current_game = None
-            for row in reader:
-                if current_game_id != row['gameid']:
-                    current_game_id = row['gameid']
-                    if current_game is not None:
-                        current_game.finish_game()
-                        yield current_game
-                    current_game = Game(game_id=row['gameid'])
-                play = self._playmaker.make_play(current_game.home,
-                                                 current_game.away,
-                                                 row)
-                current_game.add_play(play)
-            if current_game is not None:
-                yield current_game
+        if min(self.workers, multiprocessing.cpu_count()) > 1:
+            for game in self._iter_games_parallel():
+                yield game
+            return
+        with open(self._csvfile, 'rb') as fhandle:
+            rows = iter_rows(fhandle, self.columns)
+            for game in _build_games(rows, self._playmaker):
+                yield game
+
+    @property
+    def index(self):
+        """The GameIndex of the file, loaded (or built) on first use,
+        and again whenever the file changes."""
+        if self._index is None or not self._index.is_current():
+            self._index = GameIndex.load(self._csvfile, self.index_path)
+        return self._index
+
+    def get_game(self, game_id):
+        """Build the game with id game_id.  Raises KeyError if the
+        file has no such game."""
+        index = self.index
+        start, end, num_rows = index.games[game_id]
+        lines = _read_lines(self._csvfile, start, end)
+        rows = list(iter_rows(lines, self.columns, index.fieldnames))
+        return _build_game(game_id, rows, self._playmaker)
+
+    def games_for_team(self, team):
+        """Build the games of team (home or away), in file order."""
+        return [self.get_game(g) for g in self.index.find(team=team)]
+
+    def games_on(self, date):
+        """Build the games played on date (YYYYMMDD), in file order."""
+        return [self.get_game(g) for g in self.index.find(date=date)]
+
+    def _iter_games_parallel(self):
+        workers = min(self.workers, multiprocessing.cpu_count())
+        fieldnames, ranges = _partition_games(self._csvfile, 4 * workers)
+        tasks = [(self._csvfile, fieldnames, self.columns, start, end)
+                 for start, end in ranges]
+        pool = multiprocessing.Pool(workers, _init_game_worker,
+                                    (self._playmaker,))
+        try:
+            for games in pool.imap(_build_range, tasks):
+                for game in games:
+                    yield game
+        finally:
+            pool.terminate()
+            pool.join()
+
+class IncrementalGameFactory(GameFactory):
+    """A GameFactory that keeps the Games it builds in a shelve file,
+    with a fingerprint of each game's rows, and on later runs rebuilds
+    only the games that are new or whose rows have changed.
+
+    Fingerprints cover the playmaker's columns, the playmaker class,
+    the parser version (including any name exceptions loaded) and
+    the fields of the stored records (the playmaker's play_class,
+    PlaySegment and PlayDescription), so a grammar or schema change
+    rebuilds everything.  They do not cover the code of the
+    playmaker's transform: after changing it, delete the shelve file
+    (and any ParseCache file) to rebuild.
+    Give the playmaker a ParseCache with a file to keep the parsed
+    descriptions across runs as well.
+
+    After iter_games has run through the file, report() tells which
+    games were reused, rebuilt (changed) or new, and which stored
+    games were removed because they are no longer in the file.
+    Games are built in this process; workers is not used.
+
+    """
+    def __init__(self, csvfile, playmaker, filename):
+        GameFactory.__init__(self, csvfile, playmaker)
+        self.filename = filename
+        self._schema = _schema_digest(playmaker)
+        self.reused = []
+        self.rebuilt = []
+        self.new = []
+        self.removed = []
+
+    def _salt(self):
+        # parser_version() changes when name exceptions are loaded
+        return '%s\0%s\0%s\0%s' % (type(self._playmaker).__name__,
+                                   parser_version(),
+                                   ','.join(self.columns), self._schema)
+
+    def fingerprint(self, rows):
+        """Return the fingerprint of the rows of one game."""
+        digest = hashlib.sha1(self._salt())
+        for row in rows:
+            digest.update(repr([row[c] for c in self.columns]))
+        return digest.hexdigest()
+
+    def iter_games(self):
+        self.reused = []
+        self.rebuilt = []
+        self.new = []
+        self.removed = []
+        seen = set()
+        shelf = shelve.open(self.filename, protocol=2)
+        try:
+            with open(self._csvfile, 'rb') as fhandle:
+                rows = iter_rows(fhandle, self.columns)
+                for game_id, game_rows in _group_games(rows):
+                    seen.add(game_id)
+                    fingerprint = self.fingerprint(game_rows)
+                    key = game_id.encode('utf-8')
+                    stored = _shelf_get(shelf, key)
+                    if stored is not None and stored[0] == fingerprint:
+                        self.reused.append(game_id)
+                        yield stored[1]
+                        continue
+                    if stored is None:
+                        self.new.append(game_id)
+                    else:
+                        self.rebuilt.append(game_id)
+                    game = _build_game(game_id, game_rows, self._playmaker)
+                    shelf[key] = (fingerprint, game)
+                    yield game
+            for key in shelf.keys():
+                if key.decode('utf-8') not in seen:
+                    self.removed.append(key)
+                    del shelf[key]
+        finally:
+            shelf.close()
+        print '%d games: %d reused, %d rebuilt, %d new, %d removed' % (
+            len(seen), len(self.reused), len(self.rebuilt), len(self.new),
+            len(self.removed))
+
+    def report(self):
+        """Return the game ids from the last run of iter_games as a dict
+        with keys 'reused', 'rebuilt', 'new' and 'removed'."""
+        return {'reused': list(self.reused),
+                'rebuilt': list(self.rebuilt),
+                'new': list(self.new),
+                'removed': list(self.removed)}
+
+# Errors from unpickling an entry written with another layout of the
+# records: a class gone from its module (or its module gone), fields
+# unknown to _Slotted.__setstate__, or a truncated pickle.
+_stale_entry_errors = (cPickle.UnpicklingError, EOFError, AttributeError,
+                       ImportError)
+
+def _shelf_get(shelf, key):
+    # A stale entry gets a fingerprint that matches nothing.
+    try:
+        return shelf.get(key)
+    except _stale_entry_errors:
+        return ('', None)
+
+def _schema_digest(playmaker):
+    # A digest of the fields of the records in a stored Game.
+    digest = hashlib.sha1()
+    for cls in (playmaker.play_class, PlaySegment, PlayDescription):
+        digest.update('%s(%s)\0' % (cls.__name__,
+                                     ','.join(cls._all_slots())))
+    return digest.hexdigest()
+
+def _group_games(rows):
+    # Generates (game id, list of rows) for each game in an iterable
+    # of row dicts, in which the rows of each game are consecutive.
+    current_game_id = ''
+    game_rows = []
+    for row in rows:
+        if current_game_id != row['gameid']:
+            if game_rows:
+                yield current_game_id, game_rows
+            current_game_id = row['gameid']
+            game_rows = []
+        game_rows.append(row)
+    if game_rows:
+        yield current_game_id, game_rows
+
+def _build_games(rows, playmaker):
+    # Generates the Games made from an iterable of row dicts,
+    # in which the rows of each game are consecutive.  The plays
+    # of each game are made in one batch.
+    for game_id, game_rows in _group_games(rows):
+        yield _build_game(game_id, game_rows, playmaker)
+
+def _build_game(game_id, rows, playmaker):
+    game = Game(game_id=game_id)
+    for play in playmaker.make_plays(game.home, game.away, rows):
+        game.add_play(play)
+    game.finish_game()
+    return game
+
+def _row_gameid(line, column):
+    # None for a blank line
+    fields = next(reader([line]), None)
+    return fields[column] if fields else None
+
+def _partition_games(csvfile, parts):
+    # Split the rows of csvfile into about parts byte ranges, each
+    # starting at the first row of a game.  Returns the field names
+    # and a list of (start, end) offsets.
+    with open(csvfile, 'rb') as fhandle:
+        header = fhandle.readline()
+        fieldnames = next(reader([header]))
+        column = fieldnames.index('gameid')
+        data_start = fhandle.tell()
+        size = os.fstat(fhandle.fileno()).st_size
+        bounds = [data_start]
+        for k in xrange(1, parts):
+            target = data_start + (size - data_start) * k // parts
+            if target <= bounds[-1]:
+                continue
+            fhandle.seek(target)
+            fhandle.readline()   # finish the row we landed in
+            gameid = None
+            while gameid is None:
+                line = fhandle.readline()
+                if not line:
+                    break
+                gameid = _row_gameid(line, column)
+            if not line:
+                break
+            # move on to the first row of the next game
+            while True:
+                pos = fhandle.tell()
+                line = fhandle.readline()
+                if not line:
+                    break
+                row_gameid = _row_gameid(line, column)
+                if row_gameid is not None and row_gameid != gameid:
+                    break
+            if not line:
+                break
+            bounds.append(pos)
+        bounds.append(size)
+    return fieldnames, zip(bounds[:-1], bounds[1:])
+
+_worker_playmaker = None
+
+def _init_game_worker(playmaker):
+    # Pool initializer: each worker keeps its own PlayMaker.  Forked
+    # workers inherit it unpickled, so copy it through pickle to leave
+    # the file of its ParseCache behind.
+    global _worker_playmaker
+    _worker_playmaker = cPickle.loads(cPickle.dumps(playmaker, 2))
+
+def _build_range(task):
+    # Runs in worker processes: returns the Games in one byte range.
+    csvfile, fieldnames, columns, start, end = task
+    rows = iter_rows(_read_lines(csvfile, start, end), columns, fieldnames)
+    return list(_build_games(rows, _worker_playmaker))
+
+def _read_lines(csvfile, start, end):
+    # Returns the lines of csvfile in the byte range [start, end).
+    with open(csvfile, 'rb') as fhandle:
+        fhandle.seek(start)
+        return fhandle.read(end - start).splitlines(True)
+
+class GameIndex(object):
+    """Byte offsets of the games in a season file.
+
+    games maps each game id, in file order, to (start, end, rows):
+    the byte range of its rows and their number.  find looks games up
+    by date and team.
+
+    GameIndex.load can keep the index in a file of your choosing, and
+    rebuilds it when the season file's size or modification time no
+    longer match.  The season file must hold one play per line, with
+    the rows of each game together.
+
+    """
+    def __init__(self, csvfile, fieldnames, games, size, mtime):
+        self.csvfile = csvfile
+        self.fieldnames = fieldnames
+        self.games = games
+        self.size = size
+        self.mtime = mtime
+        self._by_date = {}
+        self._by_home = {}
+        self._by_away = {}
+        for game_id in games:
+            date, home, away = _parse_game_id(game_id)
+            self._by_date.setdefault(date, []).append(game_id)
+            self._by_home.setdefault(home, []).append(game_id)
+            self._by_away.setdefault(away, []).append(game_id)
+
+    @classmethod
+    def build(cls, csvfile):
+        """Scan csvfile and return its index."""
+        games = OrderedDict()
+        with open(csvfile, 'rb') as fhandle:
+            stat = os.fstat(fhandle.fileno())
+            header = fhandle.readline()
+            fieldnames = next(reader([header]))
+            column = fieldnames.index('gameid')
+            current_game_id = None
+            start = pos = fhandle.tell()
+            num_rows = 0
+            for line in iter(fhandle.readline, ''):
+                if not line.strip():
+                    # blank line
+                    pos += len(line)
+                    continue
+                if column == 0 and not line.startswith('"'):
+                    game_id = line.split(',', 1)[0]
+                else:
+                    game_id = _row_gameid(line, column)
+                if game_id != current_game_id:
+                    if current_game_id is not None:
+                        games[current_game_id] = (start, pos, num_rows)
+                    if game_id in games:
+                        raise ValueError('%s: rows of game %s are not '
+                                         'together' % (csvfile, game_id))
+                    current_game_id = game_id
+                    start = pos
+                    num_rows = 0
+                num_rows += 1
+                pos += len(line)
+            if current_game_id is not None:
+                games[current_game_id] = (start, pos, num_rows)
+        return cls(csvfile, fieldnames, games, stat.st_size, stat.st_mtime)
+
+    @classmethod
+    def load(cls, csvfile, filename=None):
+        """Return the index of csvfile, read from filename if it is up
+        to date, or else built and saved there.  Without filename, the
+        index is only built, and nothing is written."""
+        if filename is None:
+            return cls.build(csvfile)
+        if os.path.exists(filename):
+            with open(filename) as fhandle:
+                saved = json.load(fhandle)
+            games = OrderedDict((str(game_id), tuple(entry))
+                                for game_id, entry in saved['games'])
+            index = cls(csvfile, [str(f) for f in saved['fieldnames']],
+                        games, saved['size'], saved['mtime'])
+            if index.is_current():
+                return index
+        index = cls.build(csvfile)
+        index.save(filename)
+        return index
+
+    def save(self, filename):
+        with open(filename, 'w') as fhandle:
+            json.dump({'fieldnames': self.fieldnames,
+                       'size': self.size,
+                       'mtime': self.mtime,
+                       'games': self.games.items()}, fhandle)
+
+    def is_current(self):
+        """Whether the season file is unchanged since indexing."""
+        try:
+            stat = os.stat(self.csvfile)
+        except OSError:
+            return False
+        return stat.st_size == self.size and stat.st_mtime == self.mtime
+
+    def __len__(self):
+        return len(self.games)
+
+    def __contains__(self, game_id):
+        return game_id in self.games
+
+    def __iter__(self):
+        return iter(self.games)
+
+    def find(self, date=None, home=None, away=None, team=None):
+        """Return the ids of the games matching every criterion given,
+        in file order.  team matches either the home or away team."""
+        if date is not None:
+            found = self._by_date.get(date, [])
+        elif home is not None:
+            found = self._by_home.get(home, [])
+        elif away is not None:
+            found = self._by_away.get(away, [])
+        elif team is not None:
+            found = sorted(set(self._by_home.get(team, []) +
+                               self._by_away.get(team, [])),
+                           key=self._position)
+        else:
+            found = list(self.games)
+        result = []
+        for game_id in found:
+            game_date, game_home, game_away = _parse_game_id(game_id)
+            if ((date is None or game_date == date) and
+                (home is None or game_home == home) and
+                (away is None or game_away == away) and
+                (team is None or team in (game_home, game_away))):
+                result.append(game_id)
+        return result
+
+    def _position(self, game_id):
+        return self.games[game_id][0]
 
         
 class PlayMaker(object):
@@ -179,65 +830,134 @@ class PlayMaker(object):
       -- yardlines go from 0 to 100; home goal = 0, away goal = 100
       -- times count up from zero in seconds from the beginning of
          the game
+
+    An optional ParseCache is used for parsing descriptions.  Copies
+    of the PlayMaker made for worker processes have a copy of the
+    cache without its file (see ParseCache).
+
+    transform is given each Play with its base fields set, and
+    fills in the rest in place; it returns the play.
+
+    Rows are dicts as made by iter_rows; rows of strings, as made by
+    csv.DictReader, are accepted too.  columns lists the season
+    file columns make_play uses; subclasses needing others should
+    extend it.
+
+    make_plays creates each play as an instance of play_class (Play,
+    by default); transforms setting fields of their own should name a
+    Play subclass with those fields in its __slots__.
+
+    transform should parse descriptions with the parse method, which
+    keeps the results on the plays when keep_parsed is set.
+
+    Blank offense fields are filled in from the defense field.
+    repairs counts them; the first repair_log_limit are printed.
       
     """
-    def __init__(self):
-        self._parser = get_play_parser()
+    columns = ('gameid', 'min', 'sec', 'off', 'def', 'down', 'togo',
+               'ydline', 'description')
+    repair_log_limit = 10
+    play_class = Play
+    keep_parsed = False
+
+    def __init__(self, cache=None):
+        self._parser = get_play_parser(cached=True)
+        self.cache = cache
+        self.repairs = 0
+
+    def __getstate__(self):
+        # The parser is rebuilt (or shared) on unpickling.
+        state = self.__dict__.copy()
+        del state['_parser']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._parser = get_play_parser(cached=True)
 
     def make_play(self, home, away, row, new_game=False,
                   score_from_play=False):
-        new_play = Play()
+        return self.make_plays(home, away, [row], new_game)[0]
+
+    def make_plays(self, home, away, rows, new_game=False):
+        """Make the plays for a list of rows from one game.
+
+        The fields that depend only on the row (down, distance, time,
+        offense and starting yardline) are computed for all rows at
+        once; each play is then passed to transform with its
+        description.
+        """
         self.home = home
         self.away = away
-        self._parser.context = PlayDescription()
-        try:
-            new_play.down = int(row['down'])
-            new_play.togo = int(row['togo'])
-        except ValueError:
-            new_play.down = 0
-            new_play.togo = 0
-        new_play.offense = row['off']
+        down, no_down = _int_column(rows, 'down')
+        togo, no_togo = _int_column(rows, 'togo')
+        no_down |= no_togo
+        down[no_down] = 0
+        togo[no_down] = 0
+        offense = np.array([row['off'] for row in rows], dtype=object)
         # sometimes (rarely) this field is blank
         # however, when it is, there is an entry for defense.
-        if not new_play.offense:
-            print 'Repairing missing (%s @ %s)' % (away, home),
-            if row['def'] == self.away:
-                new_play.offense = self.home
-            else:
-                new_play.offense = self.away
-            print 'offense = %s' % new_play.offense
+        blank = offense == ''
+        if blank.any():
+            defense = np.array([row['def'] for row in rows], dtype=object)
+            offense[blank] = np.where(defense[blank] == away, home, away)
+            self._log_repairs(home, away, offense[blank])
         # count up seconds from zero
+        min_left, no_min = _int_column(rows, 'min')
+        sec_left, no_sec = _int_column(rows, 'sec')
+        no_min |= no_sec
+        min_left[no_min] = -1
+        sec_left[no_min] = -1
+        time = 60*(60 - min_left) - sec_left
         if new_game:
             # minutes are often incorrectly set for first play of game
-            new_play.time = 0
-        else:
-            try:
-                min_left = int(row['min'])
-                sec_left = int(row['sec'])
-            except ValueError:
-                min_left = -1
-                sec_left = -1
-            new_play.time = 60*(60 - min_left) - sec_left
+            time[0] = 0
         # in files, yardlines are set from perspective of offense
         # here, we 
-        try:
-            raw_start_yardline = int(row['ydline'])
-            if new_play.offense == self.home:
-                new_play.start_yardline = 100 - raw_start_yardline
-                new_play.yardage_mult = 1
-            else:
-                new_play.start_yardline = raw_start_yardline
-                new_play.yardage_mult = -1
-        except ValueError:
-            raw_start_yardline = np.nan
-        if not score_from_play:
-            try:
-                offscore = int(row['offscore'])
-                defscore = int(row['defscore'])
-            except ValueError:
-                offscore = -1
-                defscore = -1
-        return self.transform(new_play, row['description'])
+        raw_start_yardline, no_yardline = _int_column(rows, 'ydline')
+        is_home = offense == home
+        start_yardline = np.where(is_home, 100 - raw_start_yardline,
+                                  raw_start_yardline)
+        yardage_mult = np.where(is_home, 1, -1)
+
+        down = down.tolist()
+        togo = togo.tolist()
+        offense = offense.tolist()
+        time = time.tolist()
+        start_yardline = start_yardline.tolist()
+        yardage_mult = yardage_mult.tolist()
+        no_yardline = no_yardline.tolist()
+        play_class = self.play_class
+        plays = []
+        for i, row in enumerate(rows):
+            new_play = play_class()
+            new_play.down = down[i]
+            new_play.togo = togo[i]
+            new_play.offense = offense[i]
+            new_play.time = time[i]
+            if not no_yardline[i]:
+                new_play.start_yardline = start_yardline[i]
+                new_play.yardage_mult = yardage_mult[i]
+            plays.append(self.transform(new_play, row['description']))
+        return plays
+
+    def _log_repairs(self, home, away, offenses):
+        # Reports repaired offense fields, up to repair_log_limit.
+        for offense in offenses:
+            self.repairs += 1
+            if self.repairs <= self.repair_log_limit:
+                print 'Repairing missing (%s @ %s) offense = %s' % (
+                    away, home, offense)
+            elif self.repairs == self.repair_log_limit + 1:
+                print 'Repairing missing offense: further repairs not shown'
+
+    def parse(self, play, description):
+        """Parse description for play, returning the PlayDescription.
+        With keep_parsed set, it is also kept as play.parsed."""
+        parsed = parse_play(description, self._parser, cache=self.cache)
+        if self.keep_parsed:
+            play.parsed = parsed
+        return parsed
 
     def transform(self, play, description):
         raise NotImplementedError()    
@@ -276,9 +996,10 @@ class BasicPlayMaker(PlayMaker):
 
     """
     def transform(self, play, description):
-        parsed = parse_play(description, self._parser)
-        new_play = copy.deepcopy(play)
-        if parsed.is_error:
+        parsed = self.parse(play, description)
+        new_play = play
+        if parsed.is_error or new_play.start_yardline is NOT_SET:
+            # no yardage without a starting yardline
             new_play.type = 'NA'
         else:
             seg = [s for s in parsed.segments if s.type != 'NULL']
@@ -287,7 +1008,7 @@ class BasicPlayMaker(PlayMaker):
                 new_play.type = segment.type
                 # default to no gain
                 end = new_play.start_yardline
-                if hasattr(segment, 'end_zone_result'):
+                if segment.end_zone_result is not NOT_SET:
                     new_play.end_zone_result = segment.end_zone_result
                 else:
                     new_play.end_zone_result = 'NA'
@@ -296,9 +1017,7 @@ class BasicPlayMaker(PlayMaker):
                         new_play.offense, segment, 'end_yardline'
                         )
                     # deal with ambiguity with ending yardline
-                elif (new_play.type == 'PASS' and 
-                      hasattr(segment, 'pass_complete') and 
-                      segment.pass_complete):
+                elif new_play.type == 'PASS' and segment.pass_complete:
                     end = self._get_yardline(
                         new_play.offense, segment, 'end_yardline'
                         )
@@ -0,0 +1,146 @@
+############################################################
+#
+# cache.py
+#
+# A cache of parse results keyed by description, for the
+# many descriptions that repeat verbatim (touchbacks, kneel
+# downs, 'END QUARTER', ...).
+#
+# Entries live in a bounded in-memory LRU table and, if a
+# filename is given, in a shelve file as well, so that
+# reruns over the same seasons can skip parsing.  Keys
+# include parse_states.parser_version(), so results from an
+# older grammar, or from before name exceptions were loaded,
+# are never returned.
+#
+# Pass a ParseCache to parse_play, parse_plays or a
+# PlayMaker.  Results are copied on the way in and out, so
+# callers are free to mutate what they get.
+#
+############################################################
+
+import shelve
+from collections import OrderedDict
+from parse_states import parser_version
+
+class ParseCache(object):
+    """LRU cache of parse results.
+
+    Arguments:
+    ----------
+    max_size: number of descriptions to keep in memory.
+    filename: optional shelve file backing the cache.  Created if
+    it does not exist; close the cache (or use it in a with block)
+    to make sure everything is written.
+    version: parser version to key entries with (default: the
+    current parse_states.parser_version(); when it changes, the
+    in-memory table is emptied).
+
+    hits, misses and disk_hits count lookups; disk_hits are the hits
+    that were served from the file.
+
+    Pickled copies, such as those used by the worker processes of a
+    GameFactory or Seasons.load, have the in-memory table but not the
+    file: only this cache reads and writes it.
+    """
+    def __init__(self, max_size=10000, filename=None, version=None):
+        self.max_size = max_size
+        self._version = version
+        self._entries = OrderedDict()
+        self._entries_version = self.version
+        self._shelf = None
+        if filename is not None:
+            self._shelf = shelve.open(filename, protocol=2)
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __getstate__(self):
+        # Copies (e.g. those sent to worker processes) keep only the
+        # in-memory table: the file stays with this cache.
+        state = self.__dict__.copy()
+        state['_shelf'] = None
+        return state
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def version(self):
+        if self._version is None:
+            return parser_version()
+        return self._version
+
+    def _check_version(self):
+        # Empty the in-memory table if the version has changed since
+        # its entries were stored; returns the version.
+        version = self.version
+        if version != self._entries_version:
+            self._entries.clear()
+            self._entries_version = version
+        return version
+
+    def _disk_key(self, description, version):
+        # shelve wants byte string keys
+        if isinstance(description, unicode):
+            description = description.encode('utf-8')
+        return '%s\0%s' % (version, description)
+
+    def lookup(self, description):
+        """Return a copy of the cached (PlayDescription, ParseError)
+        pair for description, or None if it is not cached.  The error
+        is None for plays that parsed."""
+        version = self._check_version()
+        entries = self._entries
+        entry = entries.pop(description, None)
+        if entry is None and self._shelf is not None:
+            entry = self._shelf.get(self._disk_key(description, version))
+            if entry is not None:
+                self.disk_hits += 1
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        entries[description] = entry
+        if len(entries) > self.max_size:
+            entries.popitem(last=False)
+        result, err = entry
+        return (result.copy(), err)
+
+    def store(self, description, result, err=None):
+        """Cache result (a PlayDescription) and the ParseError, if
+        any, for description."""
+        version = self._check_version()
+        entry = (result.copy(), err)
+        entries = self._entries
+        entries.pop(description, None)
+        entries[description] = entry
+        if len(entries) > self.max_size:
+            entries.popitem(last=False)
+        if self._shelf is not None:
+            self._shelf[self._disk_key(description, version)] = entry
+
+    def clear(self):
+        """Empty the in-memory table and reset the counters.
+        The file, if any, is left alone."""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+    def sync(self):
+        """Write any pending entries to the file."""
+        if self._shelf is not None:
+            self._shelf.sync()
+
+    def close(self):
+        """Close the file, if any.  The in-memory table stays usable."""
+        if self._shelf is not None:
+            self._shelf.close()
+            self._shelf = None
@@ -0,0 +1,270 @@
+############################################################
+#
+# columnar.py
+#
+# Column-wise storage of parse results, for analysing many
+# seasons without holding millions of PlayDescription and
+# PlaySegment objects.
+#
+# Each segment field gets one NumPy array, with one entry
+# per segment; play_index and segment_index say which play
+# (and which segment of it) an entry belongs to.  Columns are
+# encoded by kind:
+#
+#   - booleans:   int8, 1/0, or -1 when not set
+#   - numbers:    float64, NaN when not set
+#   - yardlines:  float64 number (NaN when not set), plus a
+#                 categorical <field>_team column for the
+#                 (team, number) form
+#   - others:     categorical int32 codes into
+#                 categories[field], -1 when not set (or None)
+#
+# E.g., all completed passes:
+#
+#   table = parse_plays(plays, columnar=True)
+#   mask = ((table.columns['type'] == table.code('type', 'PASS')) &
+#           (table.columns['pass_complete'] == 1))
+#
+############################################################
+
+import numpy as np
+from parser_types import (NOT_SET, PlayDescription, PlaySegment,
+                          segment_fields)
+
+_fields = segment_fields + ('safety',)
+
+_bool_fields = frozenset(['pass_complete', 'penalty_accepted', 'turnover',
+                          'pass_intercepted', 'field_goal_made',
+                          'kick_blocked', 'attempt_success', 'reversed',
+                          'noplay', 'done', 'safety'])
+
+_number_fields = frozenset(['yardage', 'penalty_yards'])
+
+_yardline_fields = frozenset(['end_yardline', 'penalty_yardline',
+                              'fumble_yardline', 'recover_yardline'])
+
+# Names of all categorical columns, in field order.
+_category_columns = tuple(f + '_team' if f in _yardline_fields else f
+                          for f in _fields
+                          if f not in _bool_fields and
+                          f not in _number_fields)
+
+class ColumnarPlays(object):
+    """Parse results for a batch of plays, stored column-wise.
+
+    Attributes:
+    -----------
+    columns: dict mapping each segment field (and <field>_team for
+    yardline fields) to an array with one entry per segment.
+    categories: dict mapping each categorical column to the tuple of
+    its values; a code in the column is an index into this tuple.
+    play_index, segment_index: for each segment, the index of its
+    play in the batch, and its index within the play.
+    is_error, clockmin, clocksec: arrays with one entry per play;
+    clock times are NaN when not given.
+
+    Build one with parse_plays(..., columnar=True), from_plays or
+    load.
+    """
+    def __init__(self, columns, categories, play_index, segment_index,
+                 is_error, clockmin, clocksec):
+        self.columns = columns
+        self.categories = categories
+        self.play_index = play_index
+        self.segment_index = segment_index
+        self.is_error = is_error
+        self.clockmin = clockmin
+        self.clocksec = clocksec
+        self._codes = {}
+
+    def __len__(self):
+        return len(self.play_index)
+
+    @property
+    def n_plays(self):
+        return len(self.is_error)
+
+    @classmethod
+    def from_plays(cls, plays):
+        """Build from an iterable of PlayDescriptions."""
+        builder = ColumnBuilder()
+        for play in plays:
+            builder.add_play(play)
+        return builder.finish()
+
+    def code(self, column, value):
+        """Return the code of value in a categorical column,
+        or -1 if it does not occur."""
+        codes = self._codes.get(column)
+        if codes is None:
+            codes = self._codes[column] = dict(
+                (v, i) for i, v in enumerate(self.categories[column]))
+        return codes.get(value, -1)
+
+    def values(self, column):
+        """Return a column as a list of Python values (NOT_SET where
+        not set), decoding categories."""
+        array = self.columns[column]
+        if column in self.categories:
+            cats = self.categories[column]
+            return [cats[c] if c >= 0 else NOT_SET for c in array]
+        elif column in _bool_fields:
+            return [bool(b) if b >= 0 else NOT_SET for b in array]
+        else:
+            return [int(x) if x == x else NOT_SET for x in array]
+
+    def segment(self, i):
+        """Return segment i as a PlaySegment."""
+        seg = PlaySegment()
+        for f in _fields:
+            if f in _yardline_fields:
+                number = self.columns[f][i]
+                if number != number:
+                    continue
+                team = self.columns[f + '_team'][i]
+                if team >= 0:
+                    value = (self.categories[f + '_team'][team], int(number))
+                else:
+                    value = int(number)
+            elif f in _bool_fields:
+                value = self.columns[f][i]
+                if value < 0:
+                    continue
+                value = bool(value)
+            elif f in _number_fields:
+                value = self.columns[f][i]
+                if value != value:
+                    continue
+                value = int(value)
+            else:
+                value = self.columns[f][i]
+                if value < 0:
+                    continue
+                value = self.categories[f][value]
+            setattr(seg, f, value)
+        return seg
+
+    def to_plays(self):
+        """Return the batch as a list of PlayDescriptions.
+        Segment types that were None come back as None."""
+        plays = []
+        for i in xrange(self.n_plays):
+            play = PlayDescription()
+            play.is_error = bool(self.is_error[i])
+            if self.clockmin[i] == self.clockmin[i]:
+                play.clockmin = int(self.clockmin[i])
+                play.clocksec = int(self.clocksec[i])
+            plays.append(play)
+        for i in xrange(len(self)):
+            plays[self.play_index[i]].segments.append(self.segment(i))
+        return plays
+
+    def save(self, filename):
+        """Save to a NumPy .npz file."""
+        arrays = {'play_index': self.play_index,
+                  'segment_index': self.segment_index,
+                  'is_error': self.is_error,
+                  'clockmin': self.clockmin,
+                  'clocksec': self.clocksec}
+        for column, array in self.columns.iteritems():
+            arrays['column_' + column] = array
+        for column, cats in self.categories.iteritems():
+            arrays['categories_' + column] = np.array(cats, dtype=str)
+        np.savez_compressed(filename, **arrays)
+
+    @classmethod
+    def load(cls, filename):
+        """Load from a .npz file written by save."""
+        with np.load(filename) as data:
+            columns = {}
+            categories = {}
+            for key in data.files:
+                if key.startswith('column_'):
+                    columns[key[len('column_'):]] = data[key]
+                elif key.startswith('categories_'):
+                    categories[key[len('categories_'):]] = tuple(
+                        str(v) for v in data[key])
+            return cls(columns, categories, data['play_index'],
+                       data['segment_index'], data['is_error'],
+                       data['clockmin'], data['clocksec'])
+
+class ColumnBuilder(object):
+    """Accumulates parsed plays one at a time into columns, so that
+    the PlayDescriptions need not all be kept.  Call finish to get
+    the ColumnarPlays."""
+    def __init__(self):
+        self._columns = dict((f, []) for f in _fields)
+        for column in _category_columns:
+            self._columns[column] = []
+        # column -> {value: code}
+        self._codes = dict((column, {}) for column in _category_columns)
+        self._play_index = []
+        self._segment_index = []
+        self._is_error = []
+        self._clockmin = []
+        self._clocksec = []
+
+    def _encode(self, column, value):
+        if value is NOT_SET or value is None:
+            return -1
+        codes = self._codes[column]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(codes)
+        return code
+
+    def add_play(self, play):
+        """Add the segments of a PlayDescription."""
+        nplay = len(self._is_error)
+        self._is_error.append(play.is_error)
+        clockmin = play.clockmin
+        if clockmin is NOT_SET:
+            self._clockmin.append(np.nan)
+            self._clocksec.append(np.nan)
+        else:
+            self._clockmin.append(clockmin)
+            self._clocksec.append(play.clocksec)
+        columns = self._columns
+        for nseg, seg in enumerate(play.segments):
+            self._play_index.append(nplay)
+            self._segment_index.append(nseg)
+            for f in _fields:
+                value = getattr(seg, f)
+                if f in _yardline_fields:
+                    if isinstance(value, tuple):
+                        team, value = value
+                    else:
+                        team = NOT_SET
+                    columns[f + '_team'].append(
+                        self._encode(f + '_team', team))
+                    columns[f].append(np.nan if value is NOT_SET else value)
+                elif f in _bool_fields:
+                    columns[f].append(-1 if value is NOT_SET else value)
+                elif f in _number_fields:
+                    columns[f].append(np.nan if value is NOT_SET else value)
+                else:
+                    columns[f].append(self._encode(f, value))
+
+    def finish(self):
+        """Return the ColumnarPlays for the plays added so far."""
+        columns = {}
+        for column, values in self._columns.iteritems():
+            if column in _bool_fields:
+                dtype = np.int8
+            elif column in _number_fields or column in _yardline_fields:
+                dtype = np.float64
+            else:
+                dtype = np.int32
+            columns[column] = np.array(values, dtype=dtype)
+        categories = {}
+        for column, codes in self._codes.iteritems():
+            cats = [None] * len(codes)
+            for value, code in codes.iteritems():
+                cats[code] = value
+            categories[column] = tuple(cats)
+        return ColumnarPlays(columns, categories,
+                             np.array(self._play_index, dtype=np.int32),
+                             np.array(self._segment_index, dtype=np.int16),
+                             np.array(self._is_error, dtype=bool),
+                             np.array(self._clockmin, dtype=np.float64),
+                             np.array(self._clocksec, dtype=np.float64))
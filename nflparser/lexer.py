@@ -0,0 +1,115 @@
+############################################################
+#
+# lexer.py
+#
+# Turns raw play description strings into token lists for
+# the parser.  All of the per-character work (filtering,
+# splitting punctuation, stripping &#xxx; entities and
+# folding keywords to lower case) is done with translate
+# tables and one compiled pattern, so that a description
+# is only walked a couple of times at C speed.
+#
+############################################################
+
+import re
+from collections import deque
+from itertools import product
+from vocab import codes
+from parser_types import TokenStream
+
+# Characters with no semantic meaning; deleted outright.
+_filter_chars = '!+/"'
+
+# Punctuation that is split off into tokens of its own.
+_punctuation = '-.():{}'
+
+# Words that are folded to lower case whatever their case in the
+# original description.
+_keywords = set(['touchdown', 'safety', 'touchback',
+                 'fumble', 'fumbles', 'muffs', 'recovered',
+                 'intercepted', 'aborted',
+                 'challenged', 'upheld', 'reversed',
+                 'end', 'zone', 'team'])
+
+# A token is either a single punctuation character or a maximal run
+# of characters that are neither whitespace nor punctuation.
+_token_regex = r'[%s]|[^\s%s]+' % (re.escape(_punctuation),
+                                   re.escape(_punctuation))
+_token_pattern = re.compile(_token_regex)
+_unicode_token_pattern = re.compile(_token_regex, re.UNICODE)
+_entity_pattern = re.compile(r'&#\d+;')
+
+# unicode.translate takes a mapping rather than a deletion string
+_unicode_filter = dict((ord(c), None) for c in _filter_chars)
+
+def _case_variants(word):
+    # Every upper/lower case spelling of word.
+    return (''.join(chars) for chars in
+            product(*[(c.lower(), c.upper()) for c in word]))
+
+# Maps every case variant of every keyword to the keyword itself,
+# so that folding a token is a single dict lookup.
+_keyword_fold = dict((variant, kw) for kw in _keywords
+                     for variant in _case_variants(kw))
+
+# The same, but also replacing grammar words with their
+# integer codes (see vocab.py).
+_coded_fold = dict((w, codes.get(w, w)) for w in _keyword_fold.itervalues())
+_coded_fold.update((variant, codes.get(kw, kw))
+                   for variant, kw in _keyword_fold.iteritems())
+_coded_fold.update(codes)
+
+def lex_tokens(playstr, coded=False):
+    """
+    Return a list of tokens with appropriate filtering
+    from the supplied playstr.
+
+    When coded is True, grammar words are replaced by their
+    integer codes from vocab.py.
+    """
+    if isinstance(playstr, unicode):
+        tokens = _lex_unicode(playstr)
+        if coded:
+            tokens = [codes.get(t, t) for t in tokens]
+        return tokens
+    playstr = playstr.translate(None, _filter_chars)
+    # filter any &#xxx; character weirdness if it appears
+    if '&#' in playstr:
+        playstr = _entity_pattern.sub('', playstr)
+    if coded:
+        fold = _coded_fold.get
+    else:
+        fold = _keyword_fold.get
+    return [fold(t, t) for t in _token_pattern.findall(playstr)]
+
+def _lex_unicode(playstr):
+    # Slow path for unicode input.  Unicode whitespace and case
+    # mapping are wider than their byte string counterparts, so
+    # fold keywords the long way.
+    playstr = _entity_pattern.sub('', playstr.translate(_unicode_filter))
+    return [t.lower() if t.lower() in _keywords else t
+            for t in _unicode_token_pattern.findall(playstr)]
+
+def lex_play(playstr):
+    """
+    Return a deque of tokens with appropriate filtering
+    from the supplied playstr.
+    """
+    return deque(lex_tokens(playstr))
+
+def lex_play_coded(playstr):
+    """
+    Like lex_play, but with grammar words replaced by their
+    integer codes, and returned as a TokenStream.  This is the
+    cargo the states in parse_states.py expect.
+    """
+    return TokenStream(lex_tokens(playstr, True))
+
+def lex_many(descriptions, coded=False):
+    """
+    Lex an iterable of play descriptions.  Returns a list holding,
+    for each description, the same deque of tokens that lex_play
+    (or lex_play_coded, if coded is True) would have produced.
+    """
+    lex = lex_play_coded if coded else lex_play
+    return [lex(d) for d in descriptions]
@@ -0,0 +1,108 @@
+############################################################
+#
+# names.py
+#
+# Matching of player names that do not follow the usual
+# [<first initial>, '.', <last name>] token pattern.
+#
+# The exceptions are held in a prefix trie over tokens, so
+# testing a position in a play is one walk from the root,
+# however many exceptions there are.  Most tokens do not
+# start any exception, and are rejected by a single dict
+# lookup.
+#
+# Exception files hold one name per line: the name as it is
+# written in play descriptions, a tab, and the regularized
+# name code.  Blank lines and lines starting with '#' are
+# ignored.  E.g.:
+#
+#   # written<TAB>code
+#   Roy E.Williams	Roy_E.Williams
+#   B.St.Pierre	B.St.Pierre
+#
+############################################################
+
+from lexer import lex_tokens
+
+class NameTrie(object):
+    """Prefix trie mapping token sequences to regularized name codes.
+
+    Each node is a pair [name, children], where name is the code of
+    the name ending at that node (or None) and children maps the next
+    token to the child node.
+    """
+    def __init__(self, exceptions=None):
+        """exceptions: optional dict mapping tuples of tokens to
+        name codes, as in parse_states._name_exceptions."""
+        self._root = [None, {}]
+        self._size = 0
+        if exceptions:
+            for name_key, name in exceptions.iteritems():
+                self.add(name_key, name)
+
+    def __len__(self):
+        return self._size
+
+    def add(self, name_key, name):
+        """Add the name code for the tuple of tokens name_key."""
+        if not name_key:
+            raise ValueError('empty name exception')
+        node = self._root
+        for tok in name_key:
+            child = node[1].get(tok)
+            if child is None:
+                child = node[1][tok] = [None, {}]
+            node = child
+        if node[0] is None:
+            self._size += 1
+        node[0] = name
+
+    def match(self, tokens, start=0):
+        """Match the exceptions against tokens, beginning at index start.
+
+        Returns a tuple (length, name) for the shortest exception
+        found there, or None if there is none.
+        """
+        children = self._root[1]
+        for i in xrange(start, len(tokens)):
+            node = children.get(tokens[i])
+            if node is None:
+                return None
+            if node[0] is not None:
+                return (i - start + 1, node[0])
+            children = node[1]
+        return None
+
+    def tokens(self):
+        """Return the set of all tokens appearing in any exception."""
+        found = set()
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            found.update(node[1])
+            stack.extend(node[1].itervalues())
+        return found
+
+def read_name_exceptions(filename):
+    """Read an exception file (see the top of this module).
+
+    Returns a dict mapping tuples of coded tokens, as produced by
+    lexer.lex_play_coded, to name codes.
+    """
+    exceptions = {}
+    with open(filename) as fhandle:
+        for line_num, line in enumerate(fhandle, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                written, name = line.rsplit('\t', 1)
+            except ValueError:
+                raise ValueError('%s, line %d: expected <name as written>'
+                                 '<TAB><name code>' % (filename, line_num))
+            name_key = tuple(lex_tokens(written, True))
+            if not name_key:
+                raise ValueError('%s, line %d: empty name' %
+                                 (filename, line_num))
+            exceptions[name_key] = name.strip()
+    return exceptions
@@ -10,10 +10,23 @@
 # And return the tuple:
 #    (next_state, cargo)
 # where:
-#    --> cargo is a deque of remaining tokens
+#    --> cargo is a TokenStream holding the play's tokens,
+#        with its cursor at the first unconsumed one
 #    --> context is a PlayDescription object
 #        that may be mutated by the function.
 #
+# The states below expect cargo from lexer.lex_play_coded,
+# in which grammar words and punctuation have been replaced
+# by the integer codes defined in vocab.py.  Names, team codes
+# and numbers stay strings.  Use vocab.word to get a token
+# back as a string.
+#
+# The check_* and pop_* helpers below likewise only work on
+# TokenStreams from lex_play_coded: they compare with integer
+# codes and use TokenStream methods.  Custom states built on
+# them must use the coded lexer.  A parser working on plain
+# string tokens (lexer.lex_play) needs its own helpers.
+#
 # Normal parse states must begin with 'state_'
 # Parse end states (currently only one)
 # must begin with 'state_end_'.
@@ -21,10 +34,15 @@
 ##################################################
 
 import re
-import inspect
-from parser_types import ParseError
-from itertools import islice
-from collections import deque
+import hashlib
+from parser_types import ParseError, NOT_SET
+from names import NameTrie, read_name_exceptions
+from vocab import *
+
+# Version of the grammar implemented here.  Bump it whenever a change
+# alters what the parser produces for some description, so that
+# cached results (see cache.py) from older versions are not used.
+PARSER_VERSION = 1
 
 # Convenience functions for finding ("check") or extracting ("pop"
 # frequently needed information.
@@ -38,6 +56,7 @@ _last_name     = re.compile(r"^[A-Z][a-z']")  # note included apostrophe
 _team_code     = re.compile(r'^[A-Z]{2,3}$')
 _0_to_99       = re.compile(r'^\d\d?$')
 _two_digits    = re.compile(r'^\d\d$')
+_digit_start   = re.compile(r'\d')
 
 # Most of the time, after going through the lexer,
 # names follow the format:
@@ -73,6 +92,38 @@ _name_exceptions = {('[]',)                       : 'UNKNOWN',
                     ('B', '.', 'St', '.', 'Pierre'): 'B.St.Pierre',
                     ('J', '.', 'St', '.', 'Claire'): 'J.St.Claire'}
 
+# The periods in the above arrive from the lexer as integer codes.
+_name_exceptions = dict((tuple(encode(t) for t in name_key), name)
+                        for name_key, name in _name_exceptions.iteritems())
+
+# The exceptions are matched through a prefix trie (see names.py).
+_name_trie = NameTrie(_name_exceptions)
+
+# Exceptions loaded from files change what the parser produces, so
+# they are part of parser_version().
+_loaded_exceptions = {}
+_loaded_digest = None
+
+def load_name_exceptions(filename):
+    """Add the name exceptions in filename (format described in
+    names.py) to those recognized by the parser."""
+    global _loaded_digest
+    exceptions = read_name_exceptions(filename)
+    for name_key, name in exceptions.iteritems():
+        _name_trie.add(name_key, name)
+    _name_exceptions.update(exceptions)
+    _loaded_exceptions.update(exceptions)
+    digest = hashlib.sha1(repr(sorted(_loaded_exceptions.iteritems())))
+    _loaded_digest = digest.hexdigest()[:12]
+
+def parser_version():
+    """Return the version of what the parser produces: PARSER_VERSION,
+    followed by a digest of the name exceptions loaded with
+    load_name_exceptions, if any."""
+    if _loaded_digest is None:
+        return str(PARSER_VERSION)
+    return '%s-%s' % (PARSER_VERSION, _loaded_digest)
+
 # One issue is that when parsing penalty strings, penalty descriptions
 # (e.g. 'Defensive Offsides') and the like look a lot like the 
 # continuations of last name, at least from a regex perspective.  E.g.:
@@ -91,102 +142,176 @@ _penalty_tokens = set(['Chop', 'Clipping', 'Defensive', 'Delay',
                        'Roughing', 'Running', 'Taunting', 'Tripping',
                        'Unnecessary', 'Unsportsmanlike'])
 
-# Convenience functions to check for patterns
+# Uncoded tokens that the states below compare against, as is and
+# after lower-casing.  Anything that treats other names, team codes
+# and numbers as interchangeable (see shapes.py) relies on these
+# being complete.
+_literal_tokens = frozenset(['TWO', 'Penalty', 'Lateral', 'No', '50'])
+_literal_lower_tokens = frozenset(['good', 'no', 'blocked', 'aborted'])
+
+# Convenience functions to check for patterns.
+#
+# cargo is a TokenStream (see parser_types.py) from
+# lex_play_coded; string deques from lex_play are not
+# supported.  The check_* functions never move its cursor;
+# they look ahead from it, starting offset tokens in.  The
+# pop_* functions consume.
 
 def assert_tokens_and_pop(cargo, tokens):
-    """Takes a cargo deque and either a single token or list of tokens.
-    For each provided token, it pops the first token off of cargo, and
+    """Takes a cargo stream and either a single token or list of tokens.
+    For each provided token, it pops the next token off of cargo, and
     checks that the popped token matches the provided token.
+    Tokens may be grammar word codes or strings.
     
     In case of a mismatch, raises ParseError.
     If no error, the function returns and cargo will have had the
-    first len(tokens) elements removed from it."""
-    if isinstance(tokens, basestring):
+    first len(tokens) elements consumed."""
+    if isinstance(tokens, (basestring, int)):
         tlist = [tokens]
     else:
         tlist = tokens
     for token in tlist:
-        tok = cargo.popleft()
+        tok = cargo.pop()
         if tok != token:
-            err_str = 'received unexpected token {0}, expected {1}, in {2}'
-            fun_name = inspect.stack()[1][3]
-            raise ParseError(err_str.format(tok, token, fun_name))
+            err_str = 'received unexpected token {0}, expected {1}'
+            raise ParseError(err_str.format(word(tok), word(token)),
+                             offset=cargo.pos - 1)
         
-def _check_basic_name(cargo):
-    # Check that the next 3 tokens of cargo match the usual name case of:
+# Recognizers.
+#
+# Each _match_* function takes the token tuple and a position in it,
+# and returns None if the pattern does not start there, or a tuple
+# (length, value) giving the number of tokens the pattern covers and
+# the value a pop should return.  They raise IndexError, like the
+# checks always have, when the pattern runs off the end of the play.
+#
+# The check_* and pop_* functions below go through _recognize, which
+# memoizes the result in cargo.memo, so a position tested in a skip
+# loop and then popped is only ever examined once.
+
+_UNSEEN = object()
+_PAST_END = object()
+
+def _recognize(match, cargo, offset=0):
+    # Return the (memoized) result of match at the cursor + offset.
+    i = cargo.pos + offset
+    key = (match, i)
+    result = cargo.memo.get(key, _UNSEEN)
+    if result is _UNSEEN:
+        try:
+            result = match(cargo.tokens, i)
+        except IndexError:
+            result = _PAST_END
+        cargo.memo[key] = result
+    if result is _PAST_END:
+        raise IndexError('token stream ended in {0}'.format(match.__name__))
+    return result
+
+def _check_basic_name(toks, i):
+    # Check that the 3 tokens at i match the usual name case of:
     # [[Abbreviated first name], '.', [Last name]].
-    # Does not modify cargo.
-    # Returns True on success."""
-    return (_first_initial.match(cargo[0]) and 
-            cargo[1] == '.' and
-            _last_name.match(cargo[2]))
-
-def _check_name_exception(cargo):
-    # Check whether the front of cargo includes a token or set of tokens
-    # identified as an exception and defined in _name_exceptions.
-    for k in range(1,6):
-        name_key = tuple(islice(cargo, k))
-        if name_key in _name_exceptions:
-            return True
-    return False
+    first = toks[i]
+    if first.__class__ is int or not _first_initial.match(first):
+        return False
+    last = toks[i + 1] == T_PERIOD and toks[i + 2]
+    return last and last.__class__ is not int and _last_name.match(last)
 
-def check_for_name(cargo):
-    # Combined _check_name_exception and _check_basic_name.
-    # This order is slower, but failing to check in this order led
-    # to some weird behavior in corner cases.
-    # Does not modify cargo.
-    return _check_name_exception(cargo) or _check_basic_name(cargo)
+def _match_name(toks, i):
+    # Names identified as exceptions and defined in _name_exceptions
+    # are tried first.  This order is slower, but failing to check in
+    # this order led to some weird behavior in corner cases.
+    exception = _name_trie.match(toks, i)
+    if exception is not None:
+        return exception
+    if not _check_basic_name(toks, i):
+        return None
+    # Name format is generally:
+    #    '<First_Initial>.<Last_Name>'
+    # where spaces in <Last_Name> are joined by underscores.
+    the_name = toks[i] + '.' + toks[i + 2]
+    # the following is necessary to pick up hyphenates 
+    # plus annoyances like Antawn Randle El or B. St. Pierre
+    j = i + 3
+    while j < len(toks):
+        tok = toks[j]
+        if tok == T_HYPHEN:
+            the_name += '-'
+        elif (tok.__class__ is int or not _last_name.match(tok) or
+              tok in _penalty_tokens):
+            break
+        else:
+            the_name += '_%s' % tok
+        j += 1
+    return (j - i, the_name)
+
+def _match_yardline(toks, i):
+    # Possible yardline formats:
+    #    - ['50']                       --> 50
+    #    - [<TEAM_NAME>, <NUMBER>]      --> (<TEAM>, <NUMBER>) 
+    #    - [<TEAM_NAME>, '-', <NUMBER>] --> (<TEAM>, -<NUMBER>)
+    team = toks[i]
+    if team == '50':   # case (a): the 50
+        return (1, 50)
+    if team.__class__ is int or not _team_code.match(team):
+        return None
+    tok = toks[i + 1]
+    if tok == T_HYPHEN:   # case (c): negative yard line
+        tok = toks[i + 2]
+        if tok.__class__ is not int and _0_to_99.match(tok):
+            return (3, (team, -int(tok)))
+    # case (b): non-negative yard line
+    elif tok.__class__ is not int and _0_to_99.match(tok):
+        return (2, (team, int(tok)))
+    return None
 
-def check_for_team(cargo):
+def _match_time(c, i):
+    # Game clock times, terminated by a closed parenthesis:
+    #    - [<MIN>, ':', <SEC>, ')']  --> (<MIN>, <SEC>)
+    #    - [':', <SEC>, ')']         --> (0, <SEC>)
+    #
+    # Used at the beginning of a description.
+    if (c[i].__class__ is not int and _0_to_99.match(c[i]) and
+        c[i + 1] == T_COLON and
+        c[i + 2].__class__ is not int and _two_digits.match(c[i + 2]) and
+        c[i + 3] == T_RPAREN):
+        return (4, (int(c[i]), int(c[i + 2])))
+    if (c[i] == T_COLON and
+        c[i + 1].__class__ is not int and _two_digits.match(c[i + 1]) and
+        c[i + 2] == T_RPAREN):
+        return (3, (0, int(c[i + 1])))
+    return None
+
+def check_for_name(cargo, offset=0):
+    # Check for a name, either an exception or the basic pattern.
+    return _recognize(_match_name, cargo, offset) is not None
+
+def check_for_team(cargo, offset=0):
     # Check that the next token matches the legal pattern for a name code.
-    # Does not modify cargo.
-    return _team_code.match(cargo[0])
+    tok = cargo.tokens[cargo.pos + offset]
+    return tok.__class__ is not int and _team_code.match(tok)
 
 def check_team_and_name(cargo):
     # Check that the beginning of cargo matches:
     # [<TEAM CODE>, *, <NAME>]
-    # Does not modify cargo.
-    return (check_for_team(cargo) and
-            check_for_name(list(islice(cargo, 2, None))))
+    return check_for_team(cargo) and check_for_name(cargo, 2)
 
 def check_yardline(cargo):
     # Check that the beginning of cargo matches:
     # [<YARDLINE>].
-    return (cargo[0] == '50' or # case (a): the 50 
-            (_team_code.match(cargo[0]) and # case (b): non-negative yard line
-             _0_to_99.match(cargo[1])) or 
-            (_team_code.match(cargo[0]) and # case (c): negative yard line
-             cargo[1] == '-' and _0_to_99.match(cargo[2])))
-
-def _time_ge_1min(c):
-    # Helper function to determine whether to determine whether the
-    # next tokens in c are consistent with a game clock time over
-    # one minute and terminated by a closed parenthesis.
-    #
-    # Used at the beginning of a description.
-    return (_0_to_99.match(c[0]) and c[1] == ':' and
-            _two_digits.match(c[2]) and c[3] == ')')
-
-def _time_lt_1min(c):
-    # Helper function to determine whether to determine whether the
-    # next tokens in c are consistent with a game clock time under
-    # one minute and terminated by a closed parenthesis.
-    #
-    # Used at the beginning of a description.
-    return c[0] == ':' and _two_digits.match(c[1]) and c[2] == ')'
+    return _recognize(_match_yardline, cargo) is not None
 
 def check_time(cargo):
     # Combined time check for >= 1min and < 1min cases.
-    return _time_ge_1min(cargo) or _time_lt_1min(cargo)
+    return _recognize(_match_time, cargo) is not None
 
 def check_null_play(cargo):
     # The following situations correspond to missing or corrupted data
     # in the description.  Returns True if cargo meets one of the
     # specified nullity conditions.
-    if not ''.join(cargo):  # blank, or whitespace only?
+    if not cargo:  # blank, or whitespace only?
         return True
     else:
-        play_str = ' '.join(cargo)
+        play_str = ' '.join(decode(cargo.remaining()))
         # in limited cases, *** play under review *** is specified.
         # no description data is available here
         if '*** play under review ***' in play_str:
@@ -202,73 +327,49 @@ def pop_n(cargo, n):
     # Pop the next n elements from the front of cargo and 
     # return a list with those elements
     if n > 0:
-        result = []
-        for _ in xrange(n):
-            result.append(cargo.popleft())
-        return result
+        start = cargo.pos
+        cargo.advance(n)
+        return list(cargo.tokens[start:cargo.pos])
 
 def pop_yardline(cargo):
     # After a yardline is found (via check_yardline),
-    # call this routine to grab it.
-    # Possible yardline formats:
-    #    - ['50']                       --> returns 50
-    #    - [<TEAM_NAME>, <NUMBER>]      --> returns (<TEAM>, <NUMBER>) 
-    #    - [<TEAM_NAME>, '-', <NUMBER>] --> returns (<TEAM>, -<NUMBER>)
-    if cargo[0] == '50':
-        cargo.popleft()
-        yardline = 50
-    elif check_for_team(cargo):
-        if cargo[1] != '-':
-            yardline = (cargo[0], int(cargo[1]))
-            pop_n(cargo, 2)
-        else:
-            yardline = (cargo[0], -int(cargo[2]))
-            pop_n(cargo, 3)
-    else:
+    # call this routine to grab it.  Returns 50, (<TEAM>, <NUMBER>)
+    # or (<TEAM>, -<NUMBER>); see _match_yardline.
+    yardline = _recognize(_match_yardline, cargo)
+    if yardline is None:
         raise ParseError('unable to pop yardline')
+    length, yardline = yardline
+    cargo.advance(length)
     return yardline
 
 def pop_name(cargo):
     # After passing check_for_name, this function returns
     # the found name as a string.
-    # Name format is generally:
-    #    '<First_Initial>.<Last_Name>'
-    # where spaces in <Last_Name> are joined by underscores.
-    if _check_name_exception(cargo):
-        for k in range(1,6):
-            name_key = tuple(islice(cargo, k))
-            if name_key in _name_exceptions:
-                pop_n(cargo, k)
-                return _name_exceptions[name_key]
-    elif _check_basic_name(cargo):
-        the_name = ''.join(pop_n(cargo, 3))
-        # the following is necessary to pick up hyphenates 
-        # plus annoyances like Antawn Randle El or B. St. Pierre
-        while (cargo and (_last_name.match(cargo[0]) or
-                          cargo[0] == '-')):
-            if cargo[0] in _penalty_tokens:
-                break
-            elif cargo[0] == '-':
-                the_name += cargo.popleft()
-            else:
-                the_name += '_%s' % cargo.popleft()
-        return the_name
-    else:
+    name = _recognize(_match_name, cargo)
+    if name is None:
         raise ParseError('attempt to pop name where no name found')
+    length, name = name
+    cargo.advance(length)
+    return name
+
+def _prefixed(tok, prefix):
+    # True if tok is an uncoded token beginning with prefix.
+    return tok.__class__ is not int and tok.startswith(prefix)
+
+def _is_yard(tok):
+    # Matches 'yard', 'yards' and the like.
+    return tok == T_YARDS or tok == T_YARD or _prefixed(tok, 'yard')
 
 def pop_time(cargo):
     # Given that check_for_time has passed, 
     # returns a tuple (minutes, seconds) and pops the
     # appropriate tokens from cargo, including the closing
     # parentheses.
-    if _time_ge_1min(cargo):
-        the_time = (int(cargo[0]), int(cargo[2]))
-        pop_n(cargo, 4)
-    elif _time_lt_1min(cargo):
-        the_time = (0, int(cargo[1]))
-        pop_n(cargo, 3)
-    else:
+    the_time = _recognize(_match_time, cargo)
+    if the_time is None:
         raise ParseError('attempt to pop time where no time found')
+    length, the_time = the_time
+    cargo.advance(length)
     return the_time
 
 def state_initial(context, cargo):
@@ -279,18 +380,18 @@ def state_initial(context, cargo):
         context.current_segment.type = 'NO_DESCRIPTION'
         next_state = state_end_parse_complete        
     else:
-        next_tok = cargo[0]
-        if next_tok == '(':
+        next_tok = cargo.peek()
+        if next_tok == T_LPAREN:
             # Many descriptions begin with '('
             # Usually this is the time.  It can also be other
             # information (e.g., formation) which we ignore.
-            cargo.popleft()
+            cargo.pop()
             next_state = state_acquiring_annotation
         elif next_tok == 'TWO':
             # signifies a description beginning with
             # 'TWO POINT CONVERSION ATTEMPT'.  
             # This follows its own parse rules detailed below.
-            cargo.popleft()
+            cargo.pop()
             context.current_segment.type = '2PC_ATTEMPT'
             next_state = state_get_two_point_conversion
         elif check_for_name(cargo):
@@ -309,10 +410,7 @@ def state_skip_to_period(context, cargo):
     # Skip to the next period in the cargo.
     # Most often called when we are skipping irrelevant information
     # at the beginning of acquiring a segment.
-    while True:
-        next_tok = cargo.popleft()
-        if next_tok == '.':
-            break
+    cargo.skip_past(T_PERIOD)
     return (state_wait_play_segment, cargo)
 
 def state_skip_to_next_segment(context, cargo):
@@ -332,8 +430,8 @@ def state_skip_to_next_segment(context, cargo):
         if has_name:
             pop_name(cargo)
         else:
-            next_tok = cargo.popleft()
-            if next_tok == '.':
+            next_tok = cargo.pop()
+            if next_tok == T_PERIOD:
                 next_state = state_wait_play_segment
                 break
     if not cargo:
@@ -344,8 +442,8 @@ def state_skip_to_next_segment(context, cargo):
 def state_acquiring_annotation(context, cargo):
     # Check parentheticals at beginning of the play
     # At this point, first parenthesis has been popped.
-    next_tok = cargo[0]
-    if re.match(r'\d', next_tok):
+    next_tok = cargo.peek()
+    if next_tok.__class__ is not int and _digit_start.match(next_tok):
         # If we find a digit, we've found the time.
         next_state = state_acquiring_time
     else:
@@ -357,12 +455,8 @@ def state_acquiring_annotation(context, cargo):
 
 def state_skip_outer_annotation(context, cargo):
     # Pops tokens and ignores until closing paren found.
-    while True:
-        next_tok = cargo.popleft()
-        if next_tok == ')':
-            next_state = state_wait_play_segment
-            break
-    return (next_state, cargo)
+    cargo.skip_past(T_RPAREN)
+    return (state_wait_play_segment, cargo)
 
 
 def state_acquiring_time(context, cargo):
@@ -398,31 +492,30 @@ def state_wait_play_segment(context, cargo):
         context.add_segment()
 
     # Play type dispatch conditions
-    if cargo[0] in ['PENALTY', 'Penalty']:
+    tok = cargo.peek()
+    if tok == T_PENALTY or tok == 'Penalty':
         context.current_segment.type = 'PENALTY'
         next_state = state_process_penalty
-        cargo.popleft()
-    elif cargo[0] == 'TWO':
+        cargo.pop()
+    elif tok == 'TWO':
         context.current_segment.type = '2PC_ATTEMPT'
         next_state = state_get_two_point_conversion
-    elif cargo[0] == 'Lateral':
+    elif tok == 'Lateral':
         next_state = state_check_for_lateral
-    elif cargo[0] == 'fumbles':
-        cargo.popleft()
+    elif tok == T_FUMBLES:
+        cargo.pop()
         context.current_segment.type = 'FUMBLE'
         next_state = state_process_fumble
-    elif cargo[0] == 'recovered':
-        cargo.popleft()
+    elif tok == T_RECOVERED:
+        cargo.pop()
         context.current_segment.type = 'RECOVERY'
         next_state = state_process_recovery
     elif check_for_name(cargo):
         context.current_segment.primary_name = pop_name(cargo)
         next_state = state_determine_play_type
-    elif cargo[0] == '(':
+    elif tok == T_LPAREN:
         # ignore parentheticals for now
-        while True:
-            if cargo.popleft() == ')':
-                break
+        cargo.skip_past(T_RPAREN)
         next_state = state_wait_play_segment
     else:
         next_state = state_check_for_challenge
@@ -431,12 +524,13 @@ def state_wait_play_segment(context, cargo):
 def state_determine_play_type(context, cargo):
     # Called after we have found a name in a play.
     # For now, ignore parentheticals after the name.
-    if cargo[0] == '(':
+    if cargo.peek() == T_LPAREN:
         while cargo:
-            if cargo.popleft() == ')':
+            if cargo.pop() == T_RPAREN:
                 break
     if cargo:
-        next_tok = cargo.popleft()
+        start = cargo.mark()
+        next_tok = cargo.pop()
 
         # Play segment type turns on the nature of the word that 
         # follows the initial name.  
@@ -457,69 +551,70 @@ def state_determine_play_type(context, cargo):
         #                    likely it will be interpreted as a return.
         #    Anything else: a rushing play (or possibly a return)
 
-        if next_tok == 'and':
+        if next_tok == T_AND:
             # corner case for reporting in eligible.
             if check_for_name(cargo):
                 context.current_segment.primary_name += ';' + pop_name(cargo)
             else:
                 raise ParseError('failed to get name of second reporting '
                                  'eligible receiver where expected')
-            assert_tokens_and_pop(cargo, 'reported')
+            assert_tokens_and_pop(cargo, T_REPORTED)
             context.current_segment.type = 'REPORT_IN'
             context.current_segment.done = True
             next_state = state_skip_to_next_segment
-        elif re.match(r'^report', next_tok):
+        elif next_tok == T_REPORTED or _prefixed(next_tok, 'report'):
             context.current_segment.type = 'REPORT_IN'
             context.current_segment.done = True
             next_state = state_skip_to_next_segment
-        elif next_tok == 'fumbles':
+        elif next_tok == T_FUMBLES:
             context.current_segment.type = 'FUMBLE'
             next_state = state_process_fumble
-        elif next_tok == 'muffs' and cargo[0] == 'catch':
+        elif next_tok == T_MUFFS and cargo.peek() == T_CATCH:
             context.current_segment.type = 'FUMBLE'
             next_state = state_process_fumble            
-        elif next_tok == 'kicks':
+        elif next_tok == T_KICKS:
             context.current_segment.type = 'KICKOFF'
             next_state = state_process_kick
-        elif next_tok == 'punts':
+        elif next_tok == T_PUNTS:
             # matches 'punts xx yards'
             context.current_segment.type = 'PUNT'
             next_state = state_process_kick
-        elif next_tok == 'punt':
+        elif next_tok == T_PUNT:
             # matches 'punt is BLOCKED'
             context.current_segment.type = 'PUNT'
             next_state = state_process_kick_block
-        elif re.match(r'^sacked', next_tok):
+        elif next_tok == T_SACKED or _prefixed(next_tok, 'sacked'):
             context.current_segment.type = 'SACK'
             next_state = state_get_end_yardage
-        elif re.match(r'^pass', next_tok):
+        elif next_tok == T_PASS or _prefixed(next_tok, 'pass'):
             context.current_segment.type = 'PASS'
             next_state = state_process_pass
-        elif next_tok == 'spiked':
+        elif next_tok == T_SPIKED:
             context.current_segment.type = 'PASS'
             context.current_segment.pass_complete = False
             context.current_segment.notes = 'SPIKED'
             context.current_segment.done = True
             next_state = state_skip_to_next_segment
-        elif (re.match(r'\d', next_tok) and
-              cargo[0] == 'yard' and
-              cargo[1] == 'field' and
-              cargo[2] == 'goal'):
+        elif (next_tok.__class__ is not int and
+              _digit_start.match(next_tok) and
+              cargo.peek() == T_YARD and
+              cargo.peek(1) == T_FIELD and
+              cargo.peek(2) == T_GOAL):
             context.current_segment.type = 'FG_ATTEMPT'
             context.current_segment.yardage = int(next_tok)
             pop_n(cargo, 3)
             next_state = state_process_field_goal
-        elif next_tok == 'extra' and cargo[0] == 'point':
+        elif next_tok == T_EXTRA and cargo.peek() == T_POINT:
             context.current_segment.type = 'XP_ATTEMPT'
-            cargo.popleft()
+            cargo.pop()
             next_state = state_process_field_goal
-        elif next_tok == 'to':
+        elif next_tok == T_TO:
             context.current_segment.type = 'RUN'
-            # a minor hack to backtrack in case there's no rush
-            # direction.
-            cargo.appendleft('to')
+            # backtrack in case there's no rush direction, so that
+            # state_get_end_yardage sees the 'to'.
+            cargo.rewind(start)
             next_state = state_get_end_yardage
-        elif next_tok.lower() == 'touchback':
+        elif next_tok == T_TOUCHBACK:
             context.current_segment.type = 'RUN'
             context.current_segment.end_zone_result = 'TOUCHBACK'
             context.current_segment.done = True
@@ -541,11 +636,11 @@ def state_check_for_lateral(context, cargo):
     #   Lateral to [NAME] to [YARDLINE] [...] .
     context.current_segment.type = 'NULL'
     try:
-        assert_tokens_and_pop(cargo, ['Lateral', 'to'])
+        assert_tokens_and_pop(cargo, ['Lateral', T_TO])
         if check_for_name(cargo):
             lateral_name = pop_name(cargo)
-            next_tok = cargo.popleft()
-            if next_tok == 'to' and check_yardline(cargo):
+            next_tok = cargo.pop()
+            if next_tok == T_TO and check_yardline(cargo):
                 context.current_segment.type = 'LATERAL'
                 context.current_segment.primary_name = lateral_name
                 context.current_segment.end_yardline = pop_yardline(cargo)
@@ -562,8 +657,7 @@ def state_get_two_point_conversion(context, cargo):
     # look for either "ATTEMPT SUCCEEDS" or "ATTEMPT FAILS".
     
     # Skip the initial "TWO POINT CONVERSION ATTEMPT." text.
-    while cargo.popleft() != '.':
-        pass
+    cargo.skip_past(T_PERIOD)
 
     # Check conformity with run/pass format.
     if check_for_name(cargo):
@@ -571,40 +665,39 @@ def state_get_two_point_conversion(context, cargo):
     else:
         raise ParseError('expected but did not find name '
                          'in two point conversion attempt')
-    next_tok = cargo.popleft()
-    if next_tok == 'rushes':
+    next_tok = cargo.pop()
+    if next_tok == T_RUSHES:
         context.current_segment.attempt_type = 'RUN'
-    elif next_tok == 'pass':
+    elif next_tok == T_PASS:
         context.current_segment.attempt_type = 'PASS'
-        next_tok = cargo.popleft()
-        if next_tok == 'to':   # do we expect a receiver?
+        next_tok = cargo.pop()
+        if next_tok == T_TO:   # do we expect a receiver?
             if not check_for_name(cargo):
                 raise ParseError('expected but did not find receiver '
                                  'in two point conversion attempt')
             context.current_segment.pass_target = pop_name(cargo)
-            cargo.popleft()   # skip 'is'
-        next_tok = cargo.popleft()
-        if next_tok == 'complete':
+            cargo.pop()   # skip 'is'
+        next_tok = cargo.pop()
+        if next_tok == T_COMPLETE:
             context.current_segment.pass_complete = True
-        elif next_tok == 'incomplete':
+        elif next_tok == T_INCOMPLETE:
             context.current_segment.pass_complete = False
         else:
             raise ParseError('expected "complete" or "incomplete", '
-                             'got %s' % next_tok)
+                             'got %s' % word(next_tok))
     # After determining run/pass information, skip to period.
-    while cargo.popleft() != '.':
-        pass
+    cargo.skip_past(T_PERIOD)
 
     # Check for attempt success or failure
-    cargo.popleft()  # pop 'ATTEMPT' -- TODO: turn these into assertions
-    next_tok = cargo.popleft()
-    if next_tok == 'SUCCEEDS':
+    cargo.pop()  # pop 'ATTEMPT' -- TODO: turn these into assertions
+    next_tok = cargo.pop()
+    if next_tok == T_SUCCEEDS:
         context.current_segment.attempt_success = True
-    elif next_tok == 'FAILS':
+    elif next_tok == T_FAILS:
         context.current_segment.attempt_success = False
     else:
         raise ParseError('expected "SUCCEEDS" or "FAILS", '
-                         'got %s' % next_tok)
+                         'got %s' % word(next_tok))
 
     # ... and we're done.
     next_state = state_skip_to_next_segment
@@ -626,99 +719,99 @@ def state_process_fumble(context, cargo):
     # First handle parenthetical.  This is either the name of who
     # forced the fumble, or an indicator that the fumble occurred 
     # off of an aborted snap.
-    if cargo[0] == '(':
-        cargo.popleft()
-        if cargo[0] == 'aborted':
+    if cargo.peek() == T_LPAREN:
+        cargo.pop()
+        if cargo.peek() == T_ABORTED:
             context.current_segment.fumble_forced_by = 'ABORTED_SNAP'
             pop_n(cargo, 2)
-        elif cargo[0] == 'team':
+        elif cargo.peek() == T_TEAM:
             context.current_segment.fumble_forced_by = 'TEAM'
             pop_n(cargo, 2)
         else:
-            while cargo[0] != ')':
+            while cargo.peek() != T_RPAREN:
                 if check_for_name(cargo):
                     the_name = pop_name(cargo)
                 else:
                     raise ParseError('failed to get fumble recoverer '
                                      'where expected')
-                if not hasattr(context.current_segment, 'fumble_forced_by'):
+                if context.current_segment.fumble_forced_by is NOT_SET:
                     context.current_segment.fumble_forced_by = the_name
                 else:
                     context.current_segment.fumble_forced_by += ';' + the_name
-            cargo.popleft()
+            cargo.pop()
 
     # Distinguish between cases specified above 
     while True:
-        next_tok = cargo.popleft()
+        next_tok = cargo.pop()
         # ignore any 'touched at' nonsense
-        if next_tok == 'touched' and cargo[0] == 'at':
+        if next_tok == T_TOUCHED and cargo.peek() == T_AT:
             continue
-        elif next_tok == 'at':
+        elif next_tok == T_AT:
             # expect to find yardline
             if not check_yardline(cargo):
                 raise ParseError('failed to get fumble yardline where expected')
             context.current_segment.fumble_yardline = pop_yardline(cargo)
             continue
         # expect to find recovery information
-        elif next_tok == 'recovered':
-            cargo.popleft() # skip 'by'
+        elif next_tok == T_RECOVERED:
+            cargo.pop() # skip 'by'
             if check_team_and_name(cargo):
-                context.current_segment.recover_team = cargo.popleft()
-                cargo.popleft() # skip hyphen
+                context.current_segment.recover_team = cargo.pop()
+                cargo.pop() # skip hyphen
                 context.current_segment.recover_player = pop_name(cargo)
             elif check_for_team(cargo):
-                context.current_segment.recover_team = cargo.popleft()
+                context.current_segment.recover_team = cargo.pop()
                 context.current_segment.recover_player = 'TEAM'
             else:
                 raise ParseError('expected (team and name) or (team), got '
-                                 '{0}'.format(list(cargo)[0:5]))
-            assert_tokens_and_pop(cargo, 'at')
+                                 '{0}'.format(decode(cargo.remaining()[0:5])))
+            assert_tokens_and_pop(cargo, T_AT)
             if check_yardline(cargo):
                 context.current_segment.recover_yardline = pop_yardline(cargo)
             else:
                 raise ParseError('did not obtain expected recovery yardline')
             break
-        elif next_tok == 'and' and cargo[0] == 'recovers':
+        elif next_tok == T_AND and cargo.peek() == T_RECOVERS:
             # "... and recovers at <YARDLINE>"
-            assert_tokens_and_pop(cargo, ['recovers', 'at'])
+            assert_tokens_and_pop(cargo, [T_RECOVERS, T_AT])
             if not check_yardline(cargo):
                 raise ParseError('did not obtain expected recovery yardline')
             context.current_segment.recover_yardline = pop_yardline(cargo)
             context.current_segment.turnover = False
             # indicate that last recovering team got ball
             context.current_segment.recover_team = 'LAST_TEAM'
-            if hasattr(context.current_segment, 'primary_name'):
+            if context.current_segment.primary_name is not NOT_SET:
                 recover_player = context.current_segment.primary_name
             else:
                 recover_player = 'LAST_PRIMARY'
             context.current_segment.recover_player = recover_player
             break
-        elif next_tok == 'ball' and cargo[0] == 'out':
+        elif next_tok == T_BALL and cargo.peek() == T_OUT:
             # "... ball out of bounds at <YARDLINE>"
             # "... ball out of bounds in end zone <touchback|safety>"
-            assert_tokens_and_pop(cargo, ['out', 'of', 'bounds'])
+            assert_tokens_and_pop(cargo, [T_OUT, T_OF, T_BOUNDS])
             context.current_segment.turnover = False
             context.current_segment.notes = 'BALL_OB'
-            next_tok = cargo.popleft()
-            if next_tok == 'at':
+            next_tok = cargo.pop()
+            if next_tok == T_AT:
                 if not check_yardline(cargo):
                     raise ParseError('in fumble, ball out of bounds but '
                                      'no yardline specified')
                 context.current_segment.end_yardline = pop_yardline(cargo)
-            elif next_tok == 'in':
-                assert_tokens_and_pop(cargo, ['end', 'zone'])
-                next_tok = cargo.popleft()
-                if next_tok == 'touchback':
+            elif next_tok == T_IN:
+                assert_tokens_and_pop(cargo, [T_END, T_ZONE])
+                next_tok = cargo.pop()
+                if next_tok == T_TOUCHBACK:
                     context.current_segment.end_zone_result = 'TOUCHBACK'
-                elif next_tok == 'safety':
+                elif next_tok == T_SAFETY:
                     context.current_segment.end_zone_result = 'SAFETY'
                 else:
                     raise ParseError('fumbled out of bounds in end zone; '
                                      'expected touchback or safety, '
-                                     'got %s ' % next_tok)
+                                     'got %s ' % word(next_tok))
             break
-        elif next_tok == 'declared':
-            assert_tokens_and_pop(cargo, ['dead', 'at'])
+        elif next_tok == T_DECLARED:
+            assert_tokens_and_pop(cargo, [T_DEAD, T_AT])
             if check_yardline(cargo):
                 context.current_segment.end_yardline = pop_yardline(cargo)
                 context.current_segment.turnover = False
@@ -739,13 +832,21 @@ def state_process_kick(context, cargo):
     #   --> 'downed by <NAME>'
     #   --> 'out of bounds'
     #   --> 'touchback'
-    while True:
-        if cargo[0].isdigit() and re.match('^yard', cargo[1]):
+    # The yardage is the first number followed by 'yard(s)' or
+    # another token starting with 'yard' ('yards;', 'yardsline'),
+    # which the landmark index does not hold, so scan for it.
+    toks = cargo.tokens
+    for i in xrange(cargo.pos, len(toks) - 1):
+        tok = toks[i]
+        if (tok.__class__ is not int and tok.isdigit() and
+            _is_yard(toks[i + 1])):
             break
-        else:
-            cargo.popleft()
-    context.current_segment.yardage = int(cargo.popleft())
-    cargo.popleft()
+    else:
+        cargo.seek(len(toks))
+        raise IndexError('no kick yardage found')
+    cargo.seek(i)
+    context.current_segment.yardage = int(cargo.pop())
+    cargo.pop()
     while True:
         # first, make sure to skip any names
         # that appear without the appropriate 
@@ -753,14 +854,14 @@ def state_process_kick(context, cargo):
         if check_for_name(cargo):
             pop_name(cargo)
             continue
-        next_tok = cargo.popleft()
-        if next_tok == '.':
+        next_tok = cargo.pop()
+        if next_tok == T_PERIOD:
             context.current_segment.done = True
             next_state = state_wait_play_segment
             break
-        if next_tok == 'fair':
+        if next_tok == T_FAIR:
             # "... fair catch by [NAME]"
-            assert_tokens_and_pop(cargo, ['catch', 'by'])
+            assert_tokens_and_pop(cargo, [T_CATCH, T_BY])
             if check_for_name(cargo):
                 context.current_segment.done = True
                 context.current_segment.returner = pop_name(cargo)
@@ -768,12 +869,12 @@ def state_process_kick(context, cargo):
                 break
             else:
                 raise ParseError('fair catch without returner')
-        elif next_tok.lower() == 'touchback':
+        elif next_tok == T_TOUCHBACK:
             context.current_segment.end_zone_result = 'TOUCHBACK'
             context.current_segment.done = True
             next_state = state_skip_to_next_segment
             break
-        elif next_tok in ['downed', 'out']:
+        elif next_tok == T_DOWNED or next_tok == T_OUT:
             context.current_segment.done = True
             next_state = state_skip_to_next_segment
             break
@@ -795,22 +896,22 @@ def state_process_kick_block(context, cargo):
         if check_for_name(cargo):
             pop_name(cargo)
             continue
-        next_tok = cargo.popleft()
-        if next_tok.lower() == 'recovered':
+        next_tok = cargo.pop()
+        if next_tok == T_RECOVERED:
             # "recovered by ..."
             next_state = state_process_recovery
             break
-        elif next_tok == 'ball':
+        elif next_tok == T_BALL:
             # "ball out of bounds ..."
             next_state = state_get_end_yardage
             break
-        elif next_tok == 'declared':
+        elif next_tok == T_DECLARED:
             # "declared dead in end zone"
             context.current_segment.safety = True
             context.current_segment.done = True
             next_state = state_skip_to_next_segment
             break
-        elif next_tok == '.':
+        elif next_tok == T_PERIOD:
             context.current_segment.done = True
             next_state = state_wait_play_segment
             break
@@ -826,13 +927,13 @@ def state_process_field_goal(context, cargo):
     # "... extra point is <GOOD|NO GOOD|BLOCKED|Aborted>"
 
     # We take over at the 'is' token:
-    assert_tokens_and_pop(cargo, 'is')
-    next_tok = cargo.popleft().lower()  # simplify case issues
+    assert_tokens_and_pop(cargo, T_IS)
+    next_tok = word(cargo.pop()).lower()  # simplify case issues
     if next_tok == 'good':
         context.current_segment.field_goal_made = True
         context.current_segment.done = True
         next_state = state_skip_to_next_segment
-    elif next_tok == 'no' and cargo[0].lower() == 'good':
+    elif next_tok == 'no' and word(cargo.peek()).lower() == 'good':
         context.current_segment.field_goal_made = False
         context.current_segment.done = True
         next_state = state_skip_to_next_segment
@@ -856,23 +957,23 @@ def state_check_for_challenge(context, cargo):
     #   '[...] challenged by <TEAM|"Review Assistant"> and <upheld|reversed>' 
     # Anything else is ignored.
 
-    is_challenge = False
-    while cargo:
-        if cargo[0] == 'challenged':
-            is_challenge = True
-            break
-        elif cargo[0] == '.':
-            # indicates we just do a garden variety segment skip
-            break
-        cargo.popleft()
+    # A period first indicates we just do a garden variety segment skip.
+    toks = cargo.tokens
+    landmark = cargo.find(T_CHALLENGED, T_PERIOD)
+    if landmark is None:
+        landmark = len(toks)
+    cargo.seek(landmark)
+    is_challenge = landmark < len(toks) and toks[landmark] == T_CHALLENGED
     if is_challenge:
         # grab the current sentence up to but not including the period
         # A valid challenge sentence ends with:
         #    '... and the play was (upheld|reversed)'
-        cur_sentence_words = []
-        while cargo and cargo[0] != '.':
-            cur_sentence_words.append(cargo.popleft())
-        cur_sentence = ' '.join(cur_sentence_words)
+        end = cargo.find(T_PERIOD)
+        if end is None:
+            end = len(toks)
+        cur_sentence_words = toks[landmark:end]
+        cargo.seek(end)
+        cur_sentence = ' '.join(decode(cur_sentence_words))
         # for the following test:
         # note that the second match covers a corner case early in the
         # data set.  majority of cases follow the first
@@ -887,9 +988,9 @@ def state_check_for_challenge(context, cargo):
         if (_challenge_pattern_1.match(cur_sentence) or
             _challenge_pattern_2.match(cur_sentence)):
             context.current_segment.type = 'CHALLENGE'
-            if cur_sentence_words[-1] == 'upheld':
+            if cur_sentence_words[-1] == T_UPHELD:
                 context.current_segment.reversed = False
-            elif cur_sentence_words[-1] == 'reversed':
+            elif cur_sentence_words[-1] == T_REVERSED:
                 context.current_segment.reversed = True
             else:
                 raise ParseError('found challenge but unable to determine '
@@ -906,12 +1007,12 @@ def state_process_recovery(context, cargo):
     #   "[...] recovered by <TEAM>-<NAME> [at <YARDLINE>]"
     
     # We take over at 'by'
-    next_tok = cargo.popleft()
-    if (next_tok == 'by' and
+    next_tok = cargo.pop()
+    if (next_tok == T_BY and
         check_team_and_name(cargo)):
         # check format of next section
-        team_name = cargo.popleft()
-        cargo.popleft()
+        team_name = cargo.pop()
+        cargo.pop()
         recoverer = pop_name(cargo)
         context.current_segment.recover_team = team_name
         context.current_segment.recover_player = recoverer
@@ -921,17 +1022,15 @@ def state_process_recovery(context, cargo):
         context.current_segment.type = 'NULL'
         context.current_segment.done = True
         return (state_skip_to_next_segment, cargo)
-    next_tok = cargo.popleft()
+    next_tok = cargo.pop()
     # note that not all recoveries have yardlines.
     # in cases of onside kicks, the yardline is implicit from
     # the kick yardage.
-    if (next_tok == 'at' and check_yardline(cargo)):
+    if (next_tok == T_AT and check_yardline(cargo)):
         yardline = pop_yardline(cargo)
         context.current_segment.recover_yardline = yardline
-    while cargo:
-        next_tok = cargo.popleft()
-        if next_tok == '.':
-            break
+    period = cargo.find(T_PERIOD)
+    cargo.seek(len(cargo.tokens) if period is None else period + 1)
     context.current_segment.done = True
     next_state = state_wait_play_segment
     return (next_state, cargo)
@@ -944,20 +1043,21 @@ def state_get_end_yardage(context, cargo):
     # we indicate that the play is done.
     try:
         while True:
-            next_tok = cargo.popleft()
-            if next_tok in ['at', 'to']:
+            next_tok = cargo.skip_past(T_AT, T_TO, T_SAFETY, T_TOUCHDOWN,
+                                       T_TOUCHBACK)
+            if next_tok == T_AT or next_tok == T_TO:
                 if check_yardline(cargo):
                     context.current_segment.end_yardline = pop_yardline(cargo)
                     break
-            elif next_tok.lower() == 'safety':
+            elif next_tok == T_SAFETY:
                 context.current_segment.end_yardline = 0
                 context.current_segment.end_zone_result = 'SAFETY'
                 break
-            elif next_tok.lower() == 'touchdown':
+            elif next_tok == T_TOUCHDOWN:
                 context.current_segment.end_yardline = 0
                 context.current_segment.end_zone_result = 'TOUCHDOWN'
                 break
-            elif next_tok.lower() == 'touchback':
+            elif next_tok == T_TOUCHBACK:
                 context.current_segment.end_yardline = 0
                 context.current_segment.end_zone_result = 'TOUCHBACK'
                 break
@@ -977,58 +1077,62 @@ def state_get_end_yardage(context, cargo):
 
 def state_process_pass(context, cargo):
     while True:
-        next_tok = cargo.popleft()
-        if next_tok == 'incomplete':
+        next_tok = cargo.pop()
+        if next_tok == T_INCOMPLETE:
             # "... pass [...] incomplete [direction] [to target] ."
             # "... pass [...] incomplete [direction]."
             context.current_segment.pass_complete = False
             context.current_segment.pass_intercepted = False
         # if next word is 'to', then we grab the name
-            if cargo and cargo[0] == 'to':
-                cargo.popleft()
+            if cargo and cargo.peek() == T_TO:
+                cargo.pop()
                 if check_for_name(cargo):
                     target_name = pop_name(cargo)
                     context.current_segment.pass_target = target_name
                 else:
                     err_str = 'expected name of pass target, got {0}'
-                    raise ParseError(err_str.format(pop_n(cargo, 3)))
+                    start = cargo.mark()
+                    raise ParseError(err_str.format(decode(pop_n(cargo, 3))),
+                                     offset=start)
             context.current_segment.done = True
             next_state = state_skip_to_next_segment
             break
-        elif next_tok == 'to':
+        elif next_tok == T_TO:
             # "... pass [...] to [target] to [yardline] [...] ."
             context.current_segment.pass_complete = True
             if check_for_name(cargo):
                 context.current_segment.pass_target = pop_name(cargo)
             else:
                 err_str = 'expected name of pass target, got {0}'
-                raise ParseError(err_str.format(pop_n(cargo, 3)))
+                start = cargo.mark()
+                raise ParseError(err_str.format(decode(pop_n(cargo, 3))),
+                                 offset=start)
             next_state = state_get_end_yardage
             break
-        elif next_tok == 'intended':
+        elif next_tok == T_INTENDED:
             # believe it or not, this always denotes an interception:
             # "... pass intended for [target] INTERCEPTED by [interceptor] 
             #  at [yardline]"
             context.current_segment.turnover = True
             context.current_segment.turnover_type = 'INTERCEPTION'
             context.current_segment.pass_intercepted = True
-            next_tok = cargo.popleft()
-            if next_tok == 'for' and check_for_name(cargo):
+            next_tok = cargo.pop()
+            if next_tok == T_FOR and check_for_name(cargo):
                 context.current_segment.pass_target = pop_name(cargo)
             else:
                 raise ParseError('expected but did not find target')
-            while next_tok != 'by':
-                next_tok = cargo.popleft()
+            while next_tok != T_BY:
+                next_tok = cargo.pop()
             if check_for_name(cargo):
                 context.current_segment.pass_interceptor = pop_name(cargo)
             else:
                 raise ParseError('expected but did not find interceptor')
             next_state = state_get_end_yardage
             break
-        elif next_tok == 'intercepted':
+        elif next_tok == T_INTERCEPTED:
             # "... pass INTERCEPTED by [interceptor] at [yardline] ."
-            next_tok == cargo.popleft()
-            if next_tok == 'by' and check_for_name(cargo):
+            next_tok == cargo.pop()
+            if next_tok == T_BY and check_for_name(cargo):
                 context.current_segment.pass_interceptor = pop_name(cargo)
             next_state = state_get_end_yardage
             break
@@ -1048,13 +1152,13 @@ def state_process_penalty(context, cargo):
     #   --> "declined"
     # We have already processed the "PENALTY" token
     # so we should see 'on':
-    next_tok = cargo.popleft()
-    if next_tok == 'on' and check_team_and_name(cargo):
-        context.current_segment.penalty_team = cargo.popleft()
-        cargo.popleft() # ditch the hyphen
+    next_tok = cargo.pop()
+    if next_tok == T_ON and check_team_and_name(cargo):
+        context.current_segment.penalty_team = cargo.pop()
+        cargo.pop() # ditch the hyphen
         context.current_segment.penalty_player = pop_name(cargo)
-    elif next_tok == 'on' and check_for_team(cargo):
-        context.current_segment.penalty_team = cargo.popleft()
+    elif next_tok == T_ON and check_for_team(cargo):
+        context.current_segment.penalty_team = cargo.pop()
         context.current_segment.penalty_player = 'NA'
     else:
         # if neither of these cases hold, we're just looking
@@ -1067,23 +1171,24 @@ def state_process_penalty(context, cargo):
     # now build penalty description by appending words
     # until we get to one of the sentinels that tells us to stop
     desc = ''
-    next_tok = cargo.popleft()
-    while (not (next_tok.isdigit() and re.match('^yard', cargo[0])) and
-           not next_tok in ['declined', 'offsetting', 'superseded']):
+    next_tok = cargo.pop()
+    while (not (next_tok.__class__ is not int and next_tok.isdigit() and
+                _is_yard(cargo.peek())) and
+           not next_tok in (T_DECLINED, T_OFFSETTING, T_SUPERSEDED)):
         if desc:
             desc += ' '
-        desc += next_tok
-        next_tok = cargo.popleft()
+        desc += word(next_tok)
+        next_tok = cargo.pop()
     context.current_segment.penalty_description = desc
 
     # now figure out whether the penalty was accepted, declined,
     # superseded, or whether we have an offsetting penalties situation.
-    if next_tok in ['declined', 'superseded']:
+    if next_tok == T_DECLINED or next_tok == T_SUPERSEDED:
         context.current_segment.penalty_accepted = False
-        if next_tok == 'superseded':
+        if next_tok == T_SUPERSEDED:
             context.current_segment.notes = 'SUPERSEDED'
         next_state = state_skip_to_next_segment
-    elif next_tok == 'offsetting':
+    elif next_tok == T_OFFSETTING:
         context.current_segment.penalty_accepted = False
         context.current_segment.noplay = True
         context.current_segment.notes = 'OFFSET'
@@ -1094,16 +1199,16 @@ def state_process_penalty(context, cargo):
         context.current_segment.penalty_yards = int(next_tok)
         # distinguish 'between downs' case and yardline
         pop_n(cargo, 2)  # skip "yards enforced"
-        next_tok = cargo.popleft()
-        if next_tok == 'at' and check_yardline(cargo):
+        next_tok = cargo.pop()
+        if next_tok == T_AT and check_yardline(cargo):
             context.current_segment.penalty_yardline = pop_yardline(cargo)
-        elif next_tok == 'between':
-            assert_tokens_and_pop(cargo, 'downs')
+        elif next_tok == T_BETWEEN:
+            assert_tokens_and_pop(cargo, T_DOWNS)
             context.current_segment.notes = 'ENFORCED_BETWEEN_DOWNS'
-        next_tok = cargo.popleft()
-        if next_tok == '.':
+        next_tok = cargo.pop()
+        if next_tok == T_PERIOD:
             next_state = state_wait_play_segment
-        elif next_tok == '-' and cargo.popleft() == 'No':
+        elif next_tok == T_HYPHEN and cargo.pop() == 'No':
             context.current_segment.noplay = True
             next_state = state_skip_to_next_segment
         else:
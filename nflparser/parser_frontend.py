@@ -7,56 +7,29 @@
 import sys
 import re
 import string
+import multiprocessing
 from collections import deque
-from parser_types import ParseError, PlayDescription, PlaySegment
+from itertools import islice
+from operator import attrgetter
+from parser_types import (ParseError, PlayDescription, PlaySegment,
+                          TokenStream, segment_fields)
+from lexer import lex_play, lex_play_coded
+from vocab import decode, word
 import parse_states
+from columnar import ColumnBuilder
 
 #main parser, FSM, and parsing routines
 
 _DEBUG_LEVEL = 0
 
-_keywords = set(['touchdown', 'safety', 'touchback',
-                 'fumble', 'fumbles', 'muffs', 'recovered',
-                 'intercepted', 'aborted',
-                 'challenged', 'upheld', 'reversed',
-                 'end', 'zone', 'team'])
-
-_play_attributes = ['type', 'primary_name', 'yardage', 'end_yardline',
-                    'pass_target', 'pass_complete', 
-                    'penalty_team', 'penalty_player', 'penalty_description',
-                    'penalty_accepted', 'penalty_yards', 'penalty_yardline',
-                    'turnover', 'turnover_type',
-                    'pass_intercepted', 'pass_interceptor',
-                    'fumble_forced_by', 'fumble_yardline', 
-                    'recover_team', 'recover_player', 'recover_yardline',
-                    'field_goal_made', 'kick_blocked', 'returner',
-                    'end_zone_result', 'attempt_type', 'attempt_success',
-                    'reversed', 'noplay', 'done', 'notes']
-
-def lex_play(playstr):
-    """
-    Return a list of tokens with appropriate filtering 
-    from the supplied playstr.
-    """
-    # remove punctuation with no semantic meaning
-    filterchars = '!+/"'
-    punctuation = '-.():{}'
-    outchars = []
-    for c in playstr:
-        if c in filterchars:
-            continue
-        elif c in punctuation:
-            outchars.extend([' ', c, ' '])
-        else:
-            outchars.append(c)
-    outstr = ''.join(outchars)
-    # filter any &#xxx; character weirdness if it appears
-    outstr = re.sub(r'&#\d+;', '', outstr)
-    return deque(t.lower() if t.lower() in _keywords else t
-                 for t in outstr.split())
+# CSV columns
+_play_attributes = list(segment_fields)
+
+# output lines written to a csv file at a time
+_CSV_BATCH = 1000
 
 class FSM:
-    def __init__(self, initial_state, context_type):
+    def __init__(self, initial_state, context_type, lexer=lex_play):
         """
         Container for a set of handlers.
         Handlers correspond to states and are implemented
@@ -67,13 +40,21 @@ class FSM:
         initial_state: starting state for a processing run.
         context_type: instance of class that is used to initialize
         the parse context at the beginning of a run.
+        lexer: function turning a play string into the cargo
+        the handlers expect.  Defaults to lex_play (plain string
+        tokens).  The states in parse_states, and any custom states
+        using its helpers, need lex_play_coded.
         """
         self.handlers = set()
         self.end_states = set()
         self.context = None
         self.context_type = context_type
+        self.lexer = lexer
         self.initial_state = initial_state
         self.current_state = self.initial_state
+        self.states = ()
+        self.state_ids = None
+        self.profiler = None
 
     def reset(self):
         """Resets the parser and sets the context to None. 
@@ -86,73 +67,250 @@ class FSM:
         """Add a valid state handler to the set of valid handlers.
         """
         self.handlers.add(handler)
+        self.state_ids = None
 
     def add_end_state(self, end_state):
         """Add an end state to the set of valid handlers.
         """
         self.end_states.add(end_state)
-    
-    def process(self, cargo):
-        """Process the cargo, which is a deque of tokens that have been
-        prepared for parsing with the lex_play routine.
+        self.state_ids = None
+
+    @property
+    def compiled(self):
+        return self.state_ids is not None
+
+    def compile(self):
+        """Freeze the current set of handlers for processing.
 
-        When complete, creates an appropriately modified 
+        Assigns each state an integer ID (the initial state is 0),
+        available through the states tuple and the state_ids dict.
+        Adding a state afterwards undoes this; process recompiles
+        on demand.  Returns the parser.
         """
-        self.reset()
         if not self.end_states:
             raise RuntimeError('no ending states -- cannot process')
-        if _DEBUG_LEVEL > 0:
-            state_list = []
+        others = self.handlers.union(self.end_states)
+        others.discard(self.initial_state)
+        self.states = (self.initial_state,) + tuple(
+            sorted(others, key=lambda s: s.__name__))
+        self.state_ids = dict((s, i) for i, s in enumerate(self.states))
+        if len(self.end_states) == 1:
+            self._end_state, = self.end_states
+        else:
+            self._end_state = None
+        self._end_state_set = frozenset(self.end_states)
+        return self
+
+    def locate_error(self, err, state, cargo):
+        """Fill in the location fields of a ParseError raised from
+        state while processing cargo, and return it.  Fields already
+        set by the raising state are kept.
+        """
+        if err.state is None:
+            err.state = state.__name__
+            err.state_id = self.state_ids.get(state)
+        if isinstance(cargo, TokenStream):
+            tokens = cargo.tokens
+            if err.offset is None:
+                err.offset = cargo.pos
+            offset = err.offset
+        else:
+            # a deque of string tokens, consumed from the left:
+            # positions in the original play are not known.
+            tokens = tuple(islice(cargo, 3))
+            offset = 0
+        if err.window is None:
+            err.window = tuple(decode(tokens[max(offset - 2, 0):offset + 3]))
+            if offset < len(tokens):
+                err.token = word(tokens[offset])
+        return err
+
+    def process(self, cargo):
+        """Process the cargo, which holds the tokens of a play as
+        prepared for parsing with the parser's lexer (a deque for
+        lex_play, a TokenStream for lex_play_coded).
+
+        When complete, the parsed result is left in the context
+        attribute.
+
+        If a ParseProfiler is attached (the profiler attribute),
+        each state visit is timed and recorded with it.
+        """
+        if self.state_ids is None:
+            self.compile()
+        if self.profiler is not None:
+            return self._process_profiled(cargo)
+        context = self.context = self.context_type()
+        state = prev_state = self.initial_state
+        end_state = self._end_state
+        try:
+            if end_state is not None:
+                while state is not end_state:
+                    prev_state = state
+                    state, cargo = state(context, cargo)
+            else:
+                end_states = self._end_state_set
+                while state not in end_states:
+                    prev_state = state
+                    state, cargo = state(context, cargo)
+        except IndexError:
+            self.current_state = state
+            raise self.locate_error(ParseError('premature end of string'),
+                                    state, cargo)
+        except ParseError, err:
+            self.current_state = state
+            self.locate_error(err, state, cargo)
+            raise
+        self.current_state = prev_state
+
+    def _process_profiled(self, cargo):
+        # Same as process, but reporting to self.profiler.
+        profiler = self.profiler
+        timer = profiler.timer
+        context = self.context = self.context_type()
+        state = prev_state = self.initial_state
+        end_states = self._end_state_set
+        path = []
+        try:
+            while state not in end_states:
+                path.append(state)
+                prev_state = state
+                remaining = len(cargo)
+                start = timer()
+                try:
+                    state, cargo = state(context, cargo)
+                finally:
+                    profiler.record_state(prev_state, timer() - start,
+                                          remaining - len(cargo))
+        except IndexError:
+            self.current_state = state
+            profiler.record_error(state)
+            profiler.record_path(path)
+            raise self.locate_error(ParseError('premature end of string'),
+                                    state, cargo)
+        except ParseError, err:
+            self.current_state = state
+            profiler.record_error(state)
+            profiler.record_path(path)
+            self.locate_error(err, state, cargo)
+            raise
+        self.current_state = prev_state
+        profiler.record_path(path)
+
+class TracingFSM(FSM):
+    """FSM that records the states visited on each run.
+    It does not report to an attached profiler.
+
+    After process, trace holds the names of the states visited, in
+    order.  With verbosity > 0 the trace is printed when a parse
+    fails; with verbosity > 2 it is printed for successful parses as
+    well.  Build one (e.g. with get_play_parser(trace=True)) when
+    debugging; the plain FSM does none of this bookkeeping.
+    """
+    def __init__(self, initial_state, context_type, lexer=lex_play,
+                 verbosity=1):
+        FSM.__init__(self, initial_state, context_type, lexer)
+        self.verbosity = verbosity
+        self.trace = []
+
+    def process(self, cargo):
+        if self.state_ids is None:
+            self.compile()
+        self.reset()
+        self.trace = state_list = []
+        end_states = self._end_state_set
         while True:
-            if _DEBUG_LEVEL > 0:
-                state_list.append(self.current_state.__name__)
+            state_list.append(self.current_state.__name__)
             try:
                 next_state, cargo = self.current_state(self.context, cargo)
-            except IndexError:
-                err_str = 'premature end of string in {0}'.format(
-                    self.current_state
-                    )
-                if _DEBUG_LEVEL > 0:
+            except (IndexError, ParseError), err:
+                if isinstance(err, IndexError):
+                    err = ParseError('premature end of string')
+                self.locate_error(err, self.current_state, cargo)
+                if self.verbosity > 0:
                     print 'STATE TRACE:'
                     print '\n'.join(map(lambda s: '\t' + s,state_list))
-                raise ParseError(err_str)
-            if next_state in self.end_states:
-                if _DEBUG_LEVEL > 2:
+                raise err
+            if next_state in end_states:
+                if self.verbosity > 2:
                     print 'PARSE OK - STATE TRACE:'
                     print '\n'.join(map(lambda s: '\t' + s,state_list))
                 break
             self.current_state = next_state
 
-def get_play_parser():
-    """Returns a FSM instance that is properly populated with
+_play_states = None
+_shared_parsers = {}
+
+def _find_play_states():
+    # Scan parse_states for state functions once, and remember them.
+    global _play_states
+    if _play_states is None:
+        states = [getattr(parse_states, f)
+                  for f in dir(parse_states) if
+                  re.match('^state_', f)]
+        end_states = [getattr(parse_states, f)
+                      for f in dir(parse_states) if
+                      re.match('^state_end_', f)]
+        _play_states = (states, end_states)
+    return _play_states
+
+def get_play_parser(trace=False, cached=False):
+    """Returns a compiled FSM instance that is properly populated with
     all of the relevant states in the parse_states module.
+
+    With trace=True (or when _DEBUG_LEVEL > 0), returns a TracingFSM.
+    With cached=True, returns a parser shared with every other
+    caller asking for a cached one, built on first use.
     """
-    parser = FSM(parse_states.state_initial, PlayDescription)
-    states = [getattr(parse_states, f)
-              for f in dir(parse_states) if
-              re.match('^state_', f)]
-    end_states = [getattr(parse_states, f)
-                  for f in dir(parse_states) if
-                  re.match('^state_end_', f)]
+    trace = bool(trace or _DEBUG_LEVEL > 0)
+    if cached:
+        if trace not in _shared_parsers:
+            _shared_parsers[trace] = get_play_parser(trace)
+        return _shared_parsers[trace]
+    if trace:
+        parser = TracingFSM(parse_states.state_initial, PlayDescription,
+                            lexer=lex_play_coded, verbosity=_DEBUG_LEVEL)
+    else:
+        parser = FSM(parse_states.state_initial, PlayDescription,
+                     lexer=lex_play_coded)
+    states, end_states = _find_play_states()
     for s in states:
         parser.add_state(s)
     for es in end_states:
         parser.add_end_state(es)
-    return parser
+    return parser.compile()
 
-def parse_play(play, parser, verbose=False):
+def parse_play(play, parser, verbose=False, error_summary=None, cache=None,
+               shapes=None):
     """Given a play string and a parser, tokenizes the play and sends it
     to the parser (i.e., an instance of the FSM class).
 
     Returns the appropriately parsed play, as an instance of PlayDescription.
+    If the play cannot be parsed, the ParseError is recorded with
+    error_summary (an ErrorSummary), if given.
+
+    If a ParseCache is given, results are looked up in and added to it.
+    If ShapeTemplates are given as shapes, plays are parsed through
+    them.
     """
+    if cache is not None:
+        cached = cache.lookup(play)
+        if cached is not None:
+            result, err = cached
+            if err is not None:
+                _report_error(play, err, verbose, error_summary)
+            return result
+    err = None
     try:
-        play_tokens = lex_play(play)
-        parser.process(play_tokens)
-        result = parser.context
-        parser.context = None
+        if shapes is not None:
+            result = shapes.parse(play, parser)
+        else:
+            play_tokens = parser.lexer(play)
+            parser.process(play_tokens)
+            result = parser.context
+            parser.context = None
         if _DEBUG_LEVEL > 1:
-            print parser.context
+            print result
             print '----------'
     except ParseError, err:
         result = PlayDescription()
@@ -160,54 +318,249 @@ def parse_play(play, parser, verbose=False):
         result.current_segment.type = 'ERROR'
         result.current_segment.notes = 'EXCEPTION: {0}'.format(err)
         result.is_error = True
-        if verbose:
-            print err
-            print '%d: unable to process: %s' % (total, p)
-            print '----------'                
+        _report_error(play, err, verbose, error_summary)
+    if cache is not None:
+        cache.store(play, result, err)
     return result
 
-def parse_plays(plist, verbose=False):
+def _report_error(play, err, verbose, error_summary):
+    # Helper for parse_play.
+    if error_summary is not None:
+        error_summary.record(play, err)
+    if verbose:
+        print err
+        print 'unable to process: %s' % play
+        print '    near: %s' % ' '.join(err.window or ())
+        print '----------'                
+
+def iter_parse(plist, verbose=False, profiler=None, error_summary=None,
+               cache=None, shapes=None, workers=1, chunksize=None):
+    """Generates the parsed PlayDescription for each of an iterable of
+    play descriptions, in order, as it is produced.  plist is read
+    lazily, so memory use does not grow with its length.
+
+    The arguments are as for parse_plays.
+    """
+    if workers > 1:
+        if profiler is not None or shapes is not None:
+            raise ValueError('profiler and shapes cannot be used '
+                             'with workers')
+        for result in _parse_parallel(plist, verbose, error_summary, cache,
+                                      workers, chunksize):
+            yield result
+        return
+    parser = get_play_parser(cached=True)
+    if profiler is not None:
+        previous_profiler = parser.profiler
+        parser.profiler = profiler
+    try:
+        for p in plist:
+            yield parse_play(p, parser, verbose, error_summary, cache,
+                             shapes)
+    finally:
+        if profiler is not None:
+            parser.profiler = previous_profiler
+
+def parse_plays(plist, verbose=False, profiler=None, error_summary=None,
+                columnar=False, cache=None, shapes=None, workers=1,
+                chunksize=None, dedup=False, share=False):
     """Applies the parse_play function to a list of play descriptions.
-    Returns a listed of parsed plays.
+    Returns a listed of parsed plays, or with columnar=True, a
+    ColumnarPlays holding the same results column-wise.
+
+    If a ParseProfiler is given, it is attached to the parser while
+    the plays are parsed.  If an ErrorSummary is given, the failures
+    are recorded with it.  A ParseCache (cache) and ShapeTemplates
+    (shapes) are used as in parse_play.
+
+    With workers > 1, the plays are parsed by that many processes,
+    chunksize plays at a time.  The results are the same, in the same
+    order.  A cache is then consulted and filled by the calling
+    process; profilers and shapes cannot be used.
+
+    With dedup=True, each distinct description is parsed only once
+    and its result is given to every play with that description; the
+    number of distinct descriptions and the dedup ratio (plays per
+    distinct description) are printed.  Failures are then recorded
+    with error_summary and the profiler once per distinct description.
+    Repeated plays get copies of the result, unless share=True, in
+    which case they all get the same PlayDescription object.
     """
-    parser = get_play_parser()
+    if dedup:
+        results = _parse_distinct(plist, share, verbose, profiler,
+                                  error_summary, cache, shapes, workers,
+                                  chunksize)
+    else:
+        results = iter_parse(plist, verbose, profiler, error_summary, cache,
+                             shapes, workers, chunksize)
+    return _collect(results, columnar)
+
+def _parse_distinct(plist, share, *args):
+    # Generates the results for parse_plays(dedup=True): parses the
+    # distinct descriptions in plist with iter_parse (given args),
+    # then fans the results out to every position.
+    distinct_index = {}
+    distinct = []
+    positions = []
+    for play in plist:
+        k = distinct_index.get(play)
+        if k is None:
+            k = distinct_index[play] = len(distinct)
+            distinct.append(play)
+        positions.append(k)
+    del distinct_index
+    parsed = list(iter_parse(distinct, *args))
+    if positions:
+        print '%d plays, %d distinct (dedup ratio %.2f)' % (
+            len(positions), len(distinct),
+            float(len(positions)) / len(distinct))
+    given = bytearray(len(parsed))
+    for k in positions:
+        if share or not given[k]:
+            given[k] = 1
+            yield parsed[k]
+        else:
+            yield parsed[k].copy()
+
+def _collect(results, columnar):
+    # Gathers parse_plays results into a list or ColumnarPlays,
+    # reporting counts.
     parsed = []
+    if columnar:
+        columns = ColumnBuilder()
     success = 0
     errors = 0
     total = 0
-    for p in plist:
+    for result in results:
         total += 1
-        parsed.append(parse_play(p, parser))
-        if not parsed[-1].is_error:
+        if columnar:
+            columns.add_play(result)
+        else:
+            parsed.append(result)
+        if not result.is_error:
             success += 1
         else:
             errors += 1
     print '%d total, %d OK, %d errors' % (total, success, errors)
+    if columnar:
+        return columns.finish()
     return parsed
 
+class _LastError(object):
+    # Stands in for an ErrorSummary to capture parse_play's error.
+    def __init__(self):
+        self.err = None
+
+    def record(self, play, err):
+        self.err = err
+
+def _parse_chunk(plays):
+    # Runs in worker processes: returns a (PlayDescription, ParseError
+    # or None) pair for each play.
+    parser = get_play_parser(cached=True)
+    results = []
+    for play in plays:
+        last_error = _LastError()
+        result = parse_play(play, parser, error_summary=last_error)
+        results.append((result, last_error.err))
+    return results
+
+def _parse_parallel(plist, verbose, error_summary, cache, workers,
+                    chunksize):
+    # Generates the results of parse_play for each of plist, in order,
+    # parsing with a pool of worker processes.  plist is read a chunk
+    # at a time, keeping at most 2 * workers chunks in flight.
+    if chunksize is None:
+        chunksize = 500
+    plays = iter(plist)
+    pending = deque()
+    pool = multiprocessing.Pool(workers)
+    try:
+        while True:
+            while len(pending) < 2 * workers:
+                chunk = list(islice(plays, chunksize))
+                if not chunk:
+                    break
+                hits = {}
+                todo = []
+                for i, play in enumerate(chunk):
+                    hit = cache.lookup(play) if cache is not None else None
+                    if hit is not None:
+                        hits[i] = hit
+                    else:
+                        todo.append(play)
+                pending.append((chunk, hits,
+                                pool.apply_async(_parse_chunk, (todo,))))
+            if not pending:
+                break
+            chunk, hits, async_result = pending.popleft()
+            parsed = iter(async_result.get())
+            for i, play in enumerate(chunk):
+                if i in hits:
+                    result, err = hits[i]
+                else:
+                    result, err = next(parsed)
+                    if cache is not None:
+                        cache.store(play, result, err)
+                if err is not None:
+                    _report_error(play, err, verbose, error_summary)
+                yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
 def parse_to_csv(plays, output_file, **kwargs):
-    """Parse a list of text play descriptions and output result 
+    """Parse an iterable of text play descriptions and output result
     to a semicolon-delimited csv file.
-    kwargs are passed to parse_plays.
+    kwargs are passed to iter_parse.
+
+    Plays are parsed and written as they are read, so plays may be a
+    generator of any length.
     """
-    parsed = parse_plays(plays, **kwargs)
+    plays = iter(plays)
+    remembered = deque()
+    def remember():
+        # keep each description until its result has been written
+        for play in plays:
+            remembered.append(play)
+            yield play
+    results = iter_parse(remember(), **kwargs)
+    success = 0
+    errors = 0
     with open(output_file, 'w') as ofile:
         ofile.write('play_num;segment_num;')
         ofile.write(';'.join(_play_attributes))
         ofile.write(';original_description\n')
-        for i, play_parsed in enumerate(parsed):
+        lines = []
+        for i, play_parsed in enumerate(results):
+            play = remembered.popleft()
+            if play_parsed.is_error:
+                errors += 1
+            else:
+                success += 1
             for nseg, pseg in enumerate(play_parsed.segments):
                 # start numbers with 1, not zero
                 # just a touch more human-readable
-                ofile.write('%d;%d;' % (i+1, nseg+1))
-                ofile.write(_segment_to_csv(pseg))
-                ofile.write(';')
-                ofile.write(plays[i])
-                ofile.write('\n')
+                lines.append('%d;%d;%s;%s\n' % (i+1, nseg+1,
+                                                _segment_to_csv(pseg), play))
+            if len(lines) >= _CSV_BATCH:
+                ofile.write(''.join(lines))
+                del lines[:]
+        ofile.write(''.join(lines))
+    print '%d total, %d OK, %d errors' % (success + errors, success, errors)
+
+def parse_file_to_csv(input_file, output_file, **kwargs):
+    """Parse a text file of play descriptions, one per line, and
+    output the result to a csv file as parse_to_csv does.  Blank lines
+    are skipped.  The input is read as it is parsed.
+    """
+    with open(input_file) as ifile:
+        plays = (line.rstrip('\r\n') for line in ifile)
+        parse_to_csv((p for p in plays if p), output_file, **kwargs)
+
+_get_play_attributes = attrgetter(*_play_attributes)
 
 def _segment_to_csv(play_segment):
-    """Helper function for CSV conversion."""
-    return ';'.join(str(getattr(play_segment, attr)) 
-                    if hasattr(play_segment, attr) 
-                    else 'NA' 
-                    for attr in _play_attributes) 
+    """Helper function for CSV conversion.
+    Fields that are not set print as NA."""
+    return ';'.join(map(str, _get_play_attributes(play_segment)))
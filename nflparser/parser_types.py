@@ -1,10 +1,151 @@
 #parser types definition file
 
+from bisect import bisect_left
+
 class ParseError(Exception):
-    pass
+    """Raised when a play description cannot be parsed.
+
+    Besides the message, carries where the parse failed.  A state
+    raising the error may give the offset itself; the FSM fills in
+    whatever is missing when the error leaves a state:
+
+    state: name of the state the error was raised in.
+    state_id: integer ID of that state (see FSM.compile).
+    offset: position of the offending token in the play's tokens
+    (by default the cursor position), or None if unknown.
+    window: tuple of the tokens (as strings) around offset.
+    token: the token at offset as a string, or None past the end.
+    """
+    def __init__(self, message='', state=None, state_id=None,
+                 offset=None, window=None, token=None):
+        Exception.__init__(self, message)
+        self.message = message
+        self.state = state
+        self.state_id = state_id
+        self.offset = offset
+        self.window = window
+        self.token = token
+
+    def __str__(self):
+        if self.state is None:
+            return self.message
+        return '{0} (in {1} at token {2})'.format(self.message, self.state,
+                                                  self.offset)
+
+    def __reduce__(self):
+        return (ParseError, (self.message, self.state, self.state_id,
+                             self.offset, self.window, self.token))
+
+    @property
+    def signature(self):
+        """(state, token) pair identifying the kind of failure."""
+        return (self.state, self.token)
+
+class _NotSet(object):
+    # Type of NOT_SET.  Falsy, and prints as 'NA', the value the CSV
+    # output has always used for missing fields.
+    __slots__ = ()
+
+    def __nonzero__(self):
+        return False
+
+    def __repr__(self):
+        return 'NA'
+
+    def __reduce__(self):
+        # unpickles (and copies) as the NOT_SET singleton
+        return 'NOT_SET'
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+# Value of PlaySegment and PlayDescription fields that have not been set.
+NOT_SET = _NotSet()
+
+# The fields of a PlaySegment, in CSV column order.
+segment_fields = ('type', 'primary_name', 'yardage', 'end_yardline',
+                  'pass_target', 'pass_complete', 
+                  'penalty_team', 'penalty_player', 'penalty_description',
+                  'penalty_accepted', 'penalty_yards', 'penalty_yardline',
+                  'turnover', 'turnover_type',
+                  'pass_intercepted', 'pass_interceptor',
+                  'fumble_forced_by', 'fumble_yardline', 
+                  'recover_team', 'recover_player', 'recover_yardline',
+                  'field_goal_made', 'kick_blocked', 'returner',
+                  'end_zone_result', 'attempt_type', 'attempt_success',
+                  'reversed', 'noplay', 'done', 'notes')
+
+class _Slotted(object):
+    # Base of the fixed-schema types: pickling support for every
+    # pickle protocol.  The state is a dict of the fields that are
+    # set (other fields come back as NOT_SET), so pickles stored on
+    # disk never load into the wrong fields if the slots are
+    # reordered.
+    __slots__ = ()
+
+    @classmethod
+    def _all_slots(cls):
+        # The slots of cls and its bases, base first.
+        slots = cls.__dict__.get('_slot_names')
+        if slots is None:
+            slots = []
+            for klass in reversed(cls.__mro__):
+                slots.extend(klass.__dict__.get('__slots__', ()))
+            slots = tuple(slots)
+            cls._slot_names = slots
+        return slots
+
+    def __getstate__(self):
+        state = {}
+        for f in self._all_slots():
+            v = getattr(self, f, NOT_SET)
+            if v is not NOT_SET:
+                state[f] = v
+        return state
+
+    def __setstate__(self, state):
+        for f in self._all_slots():
+            setattr(self, f, state.pop(f, NOT_SET))
+        if state:
+            raise AttributeError('unknown fields for %s: %s' %
+                                 (type(self).__name__, ', '.join(state)))
+
+class _Record(_Slotted):
+    # Base of the fixed-schema records whose empty fields read as
+    # NOT_SET (PlaySegment, builder.Play).  Subclasses may add slots;
+    # _fields is the frozenset of the defining class's slots, checked
+    # first as the common case.
+    __slots__ = ()
+    _fields = frozenset()
+
+    def __getattr__(self, name):
+        # Only called for empty slots (and unknown names).
+        if name in self._fields or name in self._all_slots():
+            return NOT_SET
+        raise AttributeError(name)
+
+    def __str__(self):
+        return ';'.join('{0}={1}'.format(k, v)
+                        for k, v in self.iter_set_fields())
+
+    def iter_set_fields(self):
+        """Generate (field, value) pairs for the fields that are set."""
+        for f in self._all_slots():
+            v = getattr(self, f)
+            if v is not NOT_SET:
+                yield f, v
+
+class PlayDescription(_Slotted):
+    """A parsed play: its segments, plus the game clock time
+    (clockmin, clocksec) if the description gave one."""
+    __slots__ = ('segments', 'is_error', 'clockmin', 'clocksec')
 
-class PlayDescription(object):
     def __init__(self):
+        self.clockmin = NOT_SET
+        self.clocksec = NOT_SET
         self.reset()
 
     def __str__(self):
@@ -20,11 +161,29 @@ class PlayDescription(object):
     def add_segment(self):
         self.segments.append(PlaySegment())
 
+    def copy(self):
+        """Return a copy that shares nothing mutable with this one."""
+        new = PlayDescription.__new__(PlayDescription)
+        new.segments = [seg.copy() for seg in self.segments]
+        new.is_error = self.is_error
+        new.clockmin = self.clockmin
+        new.clocksec = self.clocksec
+        return new
+
     @property
     def current_segment(self):
         return self.segments[-1]
 
-class PlaySegment(object):
+class PlaySegment(_Record):
+    """One segment (run, pass, penalty, ...) of a parsed play.
+
+    Has a slot for each of segment_fields, plus safety; fields the
+    parser did not set read as NOT_SET.  reset only restores the basic
+    fields (type, done, turnover, noplay).
+    """
+    __slots__ = segment_fields + ('safety',)
+    _fields = frozenset(__slots__)
+
     def __init__(self):
         self.reset()
 
@@ -34,9 +193,126 @@ class PlaySegment(object):
         self.turnover = False
         self.noplay = False
 
+    def __repr__(self):
+        return str(self)
+
+    def copy(self):
+        """Return a copy of the segment.  Field values are immutable,
+        so they are shared."""
+        new = PlaySegment.__new__(PlaySegment)
+        for f, v in self.iter_set_fields():
+            setattr(new, f, v)
+        return new
+
+class TokenStream(object):
+    """A lexed play: one immutable sequence of tokens plus a cursor.
+
+    Parse states read the play through peek/pop, and can look ahead
+    any distance without copying.  mark/rewind make backtracking free.
+    Reading past the end raises IndexError, just as popping an empty
+    deque does, which the FSM reports as a premature end of string.
+
+    memo holds results of lookahead recognizers, keyed by
+    (recognizer, absolute position); since the tokens never change,
+    an entry stays valid however the cursor moves.
+
+    find and skip_past locate landmarks (grammar word codes such as
+    T_PERIOD or T_CHALLENGED) through an index of the positions of
+    each code, built on first use, rather than by popping token by
+    token.
+    """
+    __slots__ = ('tokens', 'pos', 'memo', '_landmarks')
+
+    def __init__(self, tokens):
+        self.tokens = tuple(tokens)
+        self.pos = 0
+        self.memo = {}
+        self._landmarks = None
+
+    def __len__(self):
+        return len(self.tokens) - self.pos
+
+    def __nonzero__(self):
+        return self.pos < len(self.tokens)
+
     def __str__(self):
-        return ';'.join('{0}={1}'.format(k,v) 
-                        for k,v in self.__dict__.iteritems())
+        return ' '.join(map(str, self.remaining()))
 
     def __repr__(self):
-        return str(self)
+        return 'TokenStream(%r, pos=%d)' % (self.tokens, self.pos)
+
+    def peek(self, offset=0):
+        """Return the token offset places past the cursor (offset >= 0)."""
+        return self.tokens[self.pos + offset]
+
+    def pop(self):
+        """Return the token at the cursor and move past it."""
+        tok = self.tokens[self.pos]
+        self.pos += 1
+        return tok
+
+    def advance(self, n=1):
+        """Move the cursor past the next n tokens."""
+        end = self.pos + n
+        if end > len(self.tokens):
+            self.pos = len(self.tokens)
+            raise IndexError('advance past end of token stream')
+        self.pos = end
+
+    def mark(self):
+        """Return the cursor position, for a later rewind."""
+        return self.pos
+
+    def rewind(self, mark):
+        """Move the cursor back to a position returned by mark."""
+        self.pos = mark
+
+    def seek(self, pos):
+        """Move the cursor to pos, e.g. a position returned by find.
+        Seeking to len(tokens) exhausts the stream."""
+        self.pos = pos
+
+    def _index_landmarks(self):
+        landmarks = {}
+        for i, tok in enumerate(self.tokens):
+            if tok.__class__ is int:
+                positions = landmarks.get(tok)
+                if positions is None:
+                    landmarks[tok] = [i]
+                else:
+                    positions.append(i)
+        self._landmarks = landmarks
+        return landmarks
+
+    def find(self, *codes):
+        """Return the position of the first token at or after the
+        cursor that is one of the given grammar word codes, or None if
+        there is none.  Does not move the cursor."""
+        landmarks = self._landmarks
+        if landmarks is None:
+            landmarks = self._index_landmarks()
+        pos = self.pos
+        found = None
+        for code in codes:
+            positions = landmarks.get(code)
+            if positions:
+                i = bisect_left(positions, pos)
+                if i < len(positions) and (found is None or
+                                           positions[i] < found):
+                    found = positions[i]
+        return found
+
+    def skip_past(self, *codes):
+        """Move the cursor past the next token that is one of the given
+        codes, and return it.  If there is none, exhausts the stream
+        and raises IndexError, as popping up to it one by one would."""
+        found = self.find(*codes)
+        if found is None:
+            self.pos = len(self.tokens)
+            raise IndexError('no {0} left in token stream'.format(codes))
+        self.pos = found + 1
+        return self.tokens[found]
+
+    def remaining(self):
+        """Return a tuple of the tokens from the cursor on."""
+        return self.tokens[self.pos:]
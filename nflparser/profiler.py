@@ -0,0 +1,210 @@
+############################################################
+#
+# profiler.py
+#
+# Opt-in per-state profiling for the play FSM, and summaries
+# of the errors in a batch of plays.
+#
+# Attach a ParseProfiler to a parser (parser.profiler = p)
+# or pass one to parse_plays, parse a batch, then look at
+# p.report() or print p.format_report().  A parser with no
+# profiler attached pays a single attribute check per play.
+#
+# Likewise, pass an ErrorSummary to parse_plays
+# (error_summary=s) to collect its failures.
+#
+############################################################
+
+import random
+from collections import Counter
+from timeit import default_timer
+
+class ParseProfiler(object):
+    """Collects per-state statistics from FSM runs.
+
+    For each state function, records the number of times it was
+    entered, the cumulative time spent in it, the number of tokens it
+    consumed and the number of ParseErrors raised from it.  Also counts
+    the sequence of states (the path) each play took through the FSM.
+
+    Arguments:
+    ----------
+    max_paths: number of distinct paths to keep counts for.  Plays
+    taking any further paths are only counted in the total of
+    untracked plays, which keeps memory bounded on large batches.
+    timer: function returning the current time in seconds.
+    """
+    def __init__(self, max_paths=1000, timer=default_timer):
+        self.max_paths = max_paths
+        self.timer = timer
+        self.reset()
+
+    def reset(self):
+        self.plays = 0
+        self.errors = 0
+        # state -> [entries, seconds, tokens consumed, errors]
+        self._states = {}
+        self._paths = Counter()
+        self.untracked_paths = 0
+
+    def record_state(self, state, elapsed, consumed):
+        """Record one visit to state."""
+        stats = self._states.get(state)
+        if stats is None:
+            stats = self._states[state] = [0, 0.0, 0, 0]
+        stats[0] += 1
+        stats[1] += elapsed
+        stats[2] += consumed
+
+    def record_error(self, state):
+        """Record a ParseError raised from state."""
+        self._states[state][3] += 1
+        self.errors += 1
+
+    def record_path(self, path):
+        """Record the sequence of states taken by one play."""
+        self.plays += 1
+        path = tuple(path)
+        if path in self._paths or len(self._paths) < self.max_paths:
+            self._paths[path] += 1
+        else:
+            self.untracked_paths += 1
+
+    def report(self, top_paths=10):
+        """Return the collected statistics as a dict:
+
+           {'plays': <number of plays>,
+            'errors': <number of failed plays>,
+            'states': {<state name>: {'entries': ..., 'time': ...,
+                                      'tokens': ..., 'errors': ...}},
+            'paths': [(<tuple of state names>, <count>), ...],
+            'untracked_paths': <plays whose path was not kept>}
+
+        with paths holding the top_paths most frequent paths.
+        """
+        states = {}
+        for state, (entries, elapsed, consumed, errors) in \
+                self._states.iteritems():
+            states[state.__name__] = {'entries': entries,
+                                      'time': elapsed,
+                                      'tokens': consumed,
+                                      'errors': errors}
+        paths = [(tuple(s.__name__ for s in path), count)
+                 for path, count in self._paths.most_common(top_paths)]
+        return {'plays': self.plays,
+                'errors': self.errors,
+                'states': states,
+                'paths': paths,
+                'untracked_paths': self.untracked_paths}
+
+    def format_report(self, top_paths=10):
+        """Return the report as a text table, states sorted by time."""
+        report = self.report(top_paths)
+        lines = ['%d plays, %d errors' % (report['plays'], report['errors']),
+                 '',
+                 '%-32s %9s %10s %9s %7s' % ('state', 'entries', 'time (s)',
+                                             'tokens', 'errors')]
+        by_time = sorted(report['states'].iteritems(),
+                         key=lambda item: item[1]['time'], reverse=True)
+        for name, stats in by_time:
+            lines.append('%-32s %9d %10.4f %9d %7d' % (
+                    name, stats['entries'], stats['time'],
+                    stats['tokens'], stats['errors']))
+        lines.append('')
+        lines.append('most frequent paths:')
+        for path, count in report['paths']:
+            lines.append('%9d  %s' % (count, ' > '.join(path)))
+        if report['untracked_paths']:
+            lines.append('%9d  (untracked)' % report['untracked_paths'])
+        return '\n'.join(lines)
+
+    def __str__(self):
+        return self.format_report()
+
+class ErrorSummary(object):
+    """Collects the ParseErrors from a batch of plays in bounded memory.
+
+    Counts failures by state and by signature (the state together
+    with the token the parse failed on), and keeps a uniform random
+    sample of the failing descriptions.
+
+    Arguments:
+    ----------
+    max_signatures: number of distinct signatures to keep counts for.
+    Further signatures are only counted in the total of untracked
+    errors.
+    sample_size: number of example descriptions to keep.
+    seed: seed for the sampling, for reproducible samples.
+    """
+    def __init__(self, max_signatures=1000, sample_size=20, seed=None):
+        self.max_signatures = max_signatures
+        self.sample_size = sample_size
+        self._random = random.Random(seed)
+        self.reset()
+
+    def reset(self):
+        self.errors = 0
+        self.by_state = Counter()
+        self._signatures = Counter()
+        self.untracked_signatures = 0
+        # (description, error message) pairs
+        self.samples = []
+
+    def record(self, description, err):
+        """Record the ParseError err raised parsing description."""
+        self.errors += 1
+        self.by_state[err.state] += 1
+        signature = err.signature
+        if (signature in self._signatures or
+            len(self._signatures) < self.max_signatures):
+            self._signatures[signature] += 1
+        else:
+            self.untracked_signatures += 1
+        # reservoir sampling: every error seen so far has the same
+        # chance of being in the sample.
+        if len(self.samples) < self.sample_size:
+            self.samples.append((description, str(err)))
+        else:
+            i = self._random.randrange(self.errors)
+            if i < self.sample_size:
+                self.samples[i] = (description, str(err))
+
+    def report(self, top_signatures=10):
+        """Return the collected errors as a dict:
+
+           {'errors': <number of failed plays>,
+            'states': {<state name>: <errors>},
+            'signatures': [((<state name>, <token>), <count>), ...],
+            'untracked_signatures': <errors whose signature was not kept>,
+            'samples': [(<description>, <error message>), ...]}
+
+        with signatures holding the top_signatures most frequent ones.
+        """
+        return {'errors': self.errors,
+                'states': dict(self.by_state),
+                'signatures': self._signatures.most_common(top_signatures),
+                'untracked_signatures': self.untracked_signatures,
+                'samples': list(self.samples)}
+
+    def format_report(self, top_signatures=10):
+        """Return the report as text."""
+        report = self.report(top_signatures)
+        lines = ['%d errors' % report['errors'], '', 'by state:']
+        for state, count in sorted(report['states'].iteritems(),
+                                   key=lambda item: item[1], reverse=True):
+            lines.append('%9d  %s' % (count, state))
+        lines.append('')
+        lines.append('most frequent signatures:')
+        for (state, token), count in report['signatures']:
+            lines.append('%9d  %s at %r' % (count, state, token))
+        if report['untracked_signatures']:
+            lines.append('%9d  (untracked)' % report['untracked_signatures'])
+        lines.append('')
+        lines.append('examples:')
+        for description, message in report['samples']:
+            lines.append('  %s' % description)
+            lines.append('    -> %s' % message)
+        return '\n'.join(lines)
+
+    def __str__(self):
+        return self.format_report()
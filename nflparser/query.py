@@ -0,0 +1,344 @@
+############################################################
+#
+# query.py
+#
+# Vectorized queries over parsed plays.
+#
+# A PlayQuery selects plays from a SeasonStore (or the
+# segments of a ColumnarPlays) by predicates on the play
+# fields (down, togo, start_yardline, offense, time, ...) and
+# the segment fields (type, pass_complete, turnover_type,
+# ...).  Predicates are keyword arguments, field=value or
+# field__<op>=value, with op one of
+#
+#   eq, ne, lt, le, gt, ge   comparisons
+#   in                       value is a list of values
+#   isset                    value is True or False
+#
+# Fields that are not set match nothing but isset=False.
+# A play matches the segment predicates if any one of its
+# segments matches all of them.  E.g., 3rd-and-long passes
+# inside the opponent's 30 that were intercepted:
+#
+#   q = PlayQuery(store).filter(down=3, togo__ge=7,
+#                               yards_to_goal__le=30, type='PASS',
+#                               pass_intercepted=True)
+#   q.count(), q.plays(), q.table('offense', 'date')
+#
+# Each predicate is one NumPy comparison over a whole column.
+#
+# Besides the fields of Play and PlaySegment, play fields
+# include is_error, clockmin and clocksec (from the parse),
+# yards_to_goal (from the offense's point of view) and the
+# game fields date, home and away.
+#
+# Play and PlaySegment share two field names, type and
+# end_zone_result.  Plain, they name the segment fields (as
+# in type='PASS' above); play_type and play_end_zone_result
+# name the play fields.  Any field may be written with a
+# play_ or segment_ prefix to say which it is.
+#
+############################################################
+
+import numpy as np
+from parser_types import NOT_SET, PlayDescription
+from columnar import ColumnarPlays, _bool_fields
+from store import SeasonStore, PlayView
+
+_ops = frozenset(['eq', 'ne', 'lt', 'le', 'gt', 'ge', 'in', 'isset'])
+
+_numpy_ops = {'eq': np.equal,
+              'lt': np.less,
+              'le': np.less_equal,
+              'gt': np.greater,
+              'ge': np.greater_equal}
+
+class _Column(object):
+    # A column of a query source: its values, one per play or one
+    # per segment (level), and how they are encoded (kind: 'number',
+    # 'bool' or 'category', with categories for the last).
+    def __init__(self, level, kind, values, categories=None):
+        self.level = level
+        self.kind = kind
+        self.values = values
+        self.categories = categories
+        self._codes = None
+
+    def code(self, value):
+        # -2 (matching nothing) for values that do not occur
+        if self._codes is None:
+            self._codes = dict((v, i) for i, v in
+                               enumerate(self.categories))
+        return self._codes.get(value, -2)
+
+    def is_set(self):
+        if self.kind == 'number':
+            return ~np.isnan(self.values)
+        return self.values >= 0
+
+    def compare(self, op, value):
+        """Return the boolean mask of the entries matching op, value."""
+        values = self.values
+        if op == 'isset':
+            return self.is_set() if value else ~self.is_set()
+        if self.kind == 'bool':
+            if op == 'eq':
+                return values == int(bool(value))
+            elif op == 'ne':
+                return values == int(not value)
+            elif op == 'in':
+                return np.in1d(values, [int(bool(v)) for v in value])
+            raise ValueError('cannot use %s with a boolean field' % op)
+        if self.kind == 'category':
+            if op == 'eq':
+                return values == self.code(value)
+            elif op == 'ne':
+                return (values != self.code(value)) & (values >= 0)
+            elif op == 'in':
+                return np.in1d(values, [self.code(v) for v in value])
+            raise ValueError('cannot use %s with a string field' % op)
+        if op == 'ne':
+            return (values != value) & ~np.isnan(values)
+        elif op == 'in':
+            return np.in1d(values, list(value))
+        # NaN (not set) compares False, which is what we want
+        with np.errstate(invalid='ignore'):
+            return _numpy_ops[op](values, value)
+
+    def decode(self, index):
+        """Return the entries at index as an array of Python values,
+        NOT_SET where not set."""
+        values = self.values[index]
+        if self.kind == 'category':
+            decoded = np.array(self.categories + (NOT_SET,),
+                               dtype=object)[values]
+        elif self.kind == 'bool':
+            decoded = np.array([False, True, NOT_SET],
+                               dtype=object)[values]
+        else:
+            decoded = np.array([int(v) if v == v else NOT_SET
+                                for v in values], dtype=object)
+        return decoded
+
+class _Columns(object):
+    # Finds (and caches) the columns of a SeasonStore or ColumnarPlays.
+    def __init__(self, source):
+        if isinstance(source, SeasonStore):
+            self.store = source
+            self.segments = source.segments
+        elif isinstance(source, ColumnarPlays):
+            self.store = None
+            self.segments = source
+        else:
+            raise TypeError('cannot query %r' % type(source).__name__)
+        self.n_plays = self.segments.n_plays
+        self._cache = {}
+        self._segment_start = None
+
+    def __getitem__(self, name):
+        column = self._cache.get(name)
+        if column is None:
+            column = self._cache[name] = self._find(name)
+        return column
+
+    def _find(self, name):
+        if name.startswith('segment_'):
+            column = self._find_segment(name[len('segment_'):])
+            if column is None:
+                raise ValueError('unknown segment field: %s' % name)
+            return column
+        elif name.startswith('play_'):
+            return self._find_play(name[len('play_'):])
+        column = self._find_segment(name)
+        if column is None:
+            column = self._find_play(name)
+        return column
+
+    def _find_segment(self, name):
+        # None if there is no such segment field
+        segments = self.segments
+        if name not in segments.columns:
+            return None
+        values = segments.columns[name]
+        if name in segments.categories:
+            return _Column('segment', 'category', values,
+                           segments.categories[name])
+        elif name in _bool_fields:
+            return _Column('segment', 'bool', values)
+        return _Column('segment', 'number', values)
+
+    def _find_play(self, name):
+        segments = self.segments
+        if name == 'is_error':
+            return _Column('play', 'bool',
+                           segments.is_error.astype(np.int8))
+        elif name in ('clockmin', 'clocksec'):
+            return _Column('play', 'number', getattr(segments, name))
+        store = self.store
+        if store is None:
+            raise ValueError('unknown field: %s' % name)
+        if name in store.play_fields:
+            values = store.columns['play_' + name]
+            if 'play_' + name in store.categories:
+                return _Column('play', 'category', values,
+                               store.categories['play_' + name])
+            return _Column('play', 'number', values)
+        elif name == 'yards_to_goal':
+            start = self['start_yardline'].values
+            mult = self['yardage_mult'].values
+            return _Column('play', 'number',
+                           np.where(mult == 1, 100 - start, start))
+        elif name in ('date', 'home', 'away'):
+            game_of_play = np.repeat(np.arange(len(store)),
+                                     np.diff(store.columns['play_start']))
+            values = store.columns['game_' + name][game_of_play]
+            if name == 'date':
+                return _Column('play', 'number', values.astype(np.float64))
+            return _Column('play', 'category', values,
+                           store.categories['game_' + name])
+        raise ValueError('unknown field: %s' % name)
+
+    @property
+    def segment_start(self):
+        # index of the first segment of each play, and the total
+        if self._segment_start is None:
+            self._segment_start = np.searchsorted(
+                self.segments.play_index, np.arange(self.n_plays + 1))
+        return self._segment_start
+
+class PlayQuery(object):
+    """A query over the plays of a SeasonStore or ColumnarPlays.
+
+    filter returns a new query with more predicates (see the top of
+    this module); the results are computed when asked for.  Queries
+    made from one another share their decoded columns.
+    """
+    def __init__(self, source, _columns=None, _play_preds=(),
+                 _segment_preds=()):
+        self.source = source
+        self._columns = _columns or _Columns(source)
+        self._play_preds = _play_preds
+        self._segment_preds = _segment_preds
+        self._mask = None
+        self._segment_mask = None
+
+    def filter(self, **predicates):
+        """Return a query for the plays that also match predicates."""
+        play_preds = list(self._play_preds)
+        segment_preds = list(self._segment_preds)
+        for key, value in sorted(predicates.iteritems()):
+            name, _, op = key.partition('__')
+            op = op or 'eq'
+            if op not in _ops:
+                raise ValueError('unknown operator: %s' % key)
+            column = self._columns[name]
+            if column.kind != 'number' and op in ('lt', 'le', 'gt', 'ge'):
+                raise ValueError('cannot use %s with %s, which is not '
+                                 'a number' % (op, name))
+            field = name
+            if field.startswith('segment_'):
+                field = field[len('segment_'):]
+            if isinstance(value, tuple) and op == 'eq' and \
+                    column.level == 'segment' and \
+                    field + '_team' in self._columns.segments.columns:
+                # a (team, yardline) value
+                team, value = value
+                segment_preds.append((field + '_team', 'eq', team))
+            if column.level == 'play':
+                play_preds.append((name, op, value))
+            else:
+                segment_preds.append((name, op, value))
+        return PlayQuery(self.source, self._columns, tuple(play_preds),
+                         tuple(segment_preds))
+
+    def segment_mask(self):
+        """Boolean array over segments: those matching every segment
+        predicate (all of them if there are none)."""
+        if self._segment_mask is None:
+            columns = self._columns
+            mask = np.ones(len(columns.segments.play_index), dtype=bool)
+            for name, op, value in self._segment_preds:
+                mask &= columns[name].compare(op, value)
+            self._segment_mask = mask
+        return self._segment_mask
+
+    def mask(self):
+        """Boolean array over plays: those matching the query."""
+        if self._mask is None:
+            columns = self._columns
+            mask = np.ones(columns.n_plays, dtype=bool)
+            for name, op, value in self._play_preds:
+                mask &= columns[name].compare(op, value)
+            if self._segment_preds:
+                has_segment = np.zeros(columns.n_plays, dtype=bool)
+                has_segment[columns.segments.play_index[
+                        self.segment_mask()]] = True
+                mask &= has_segment
+            self._mask = mask
+        return self._mask
+
+    def indexes(self):
+        """Return the indexes of the matching plays."""
+        return np.flatnonzero(self.mask())
+
+    def segment_indexes(self):
+        """Return the indexes of the segments of matching plays that
+        match the segment predicates."""
+        mask = self.mask()[self._columns.segments.play_index]
+        return np.flatnonzero(mask & self.segment_mask())
+
+    def count(self):
+        return int(self.mask().sum())
+
+    def __len__(self):
+        return self.count()
+
+    def plays(self):
+        """Return the matching plays: PlayViews for a SeasonStore,
+        PlayDescriptions for a ColumnarPlays."""
+        indexes = self.indexes()
+        store = self._columns.store
+        if store is not None:
+            return [PlayView(store, i) for i in indexes]
+        segments = self._columns.segments
+        start = self._columns.segment_start
+        plays = []
+        for i in indexes:
+            play = PlayDescription()
+            play.is_error = bool(segments.is_error[i])
+            if segments.clockmin[i] == segments.clockmin[i]:
+                play.clockmin = int(segments.clockmin[i])
+                play.clocksec = int(segments.clocksec[i])
+            play.segments = [segments.segment(j)
+                             for j in xrange(start[i], start[i + 1])]
+            plays.append(play)
+        return plays
+
+    def table(self, *fields):
+        """Return a sub-table of the matching plays: a dict mapping
+        each of fields (play fields) to an array of their values,
+        NOT_SET where not set.  Includes 'play', the play indexes."""
+        indexes = self.indexes()
+        table = {'play': indexes}
+        for name in fields:
+            column = self._columns[name]
+            if column.level != 'play':
+                raise ValueError('%s is a segment field; use '
+                                 'segment_table' % name)
+            table[name] = column.decode(indexes)
+        return table
+
+    def segment_table(self, *fields):
+        """Return a sub-table of the segments matching the query, as
+        table does, with 'play' holding the index of each segment's
+        play.  fields may be play or segment fields."""
+        indexes = self.segment_indexes()
+        play_index = self._columns.segments.play_index[indexes]
+        table = {'play': play_index}
+        for name in fields:
+            column = self._columns[name]
+            if column.level == 'play':
+                table[name] = column.decode(play_index)
+            else:
+                table[name] = column.decode(indexes)
+        return table
@@ -0,0 +1,395 @@
+############################################################
+#
+# shapes.py
+#
+# A fast path for plays that share a shape.
+#
+# Most descriptions are one of a few hundred sentences with
+# different names, team codes and numbers filled in.  The
+# shape of a lexed play is its token sequence with each such
+# token replaced by a slot standing for its class: every
+# regex the states test tokens against gives the same answer
+# for all tokens of a class.  As long as a slot token is
+# never one the states compare against (a grammar word, a
+# string in parse_states._literal_tokens, a penalty word or
+# part of a name exception), the FSM takes exactly the same
+# path through every play of a shape.  The values it stores
+# are then fixed combinations of the slot tokens: the tokens
+# themselves, their integer values, or strings joined from
+# them.
+#
+# ShapeTemplates learns those combinations the first time it
+# meets a shape.  It reparses the play twice with every slot
+# token replaced by a random token of the same class, and
+# infers, for each field, a recipe that reproduces the
+# results of all three parses.  Later plays of that shape are
+# filled in from the recipes without running the FSM.  Shapes
+# whose results cannot be explained this way, plays that fail
+# to parse and challenge sentences (which the FSM matches as
+# joined strings) always go through the FSM.
+#
+# With verify=True, every filled-in play is checked against
+# the FSM, and mismatches are counted and kept as examples.
+#
+############################################################
+
+import re
+import random
+from collections import Counter
+from parser_types import (NOT_SET, ParseError, PlayDescription, PlaySegment,
+                          TokenStream)
+from vocab import T_CHALLENGED
+import parse_states
+
+_name_like = re.compile(r"^[A-Z][A-Za-z']*$")
+_number = re.compile(r'^\d+$')
+
+# The regexes the states test uncoded tokens with.
+_token_tests = (parse_states._first_initial, parse_states._last_name,
+                parse_states._team_code, parse_states._0_to_99,
+                parse_states._two_digits)
+
+_UNLEARNABLE = 'unlearnable'
+
+class _Slot(tuple):
+    # Stands for a class of tokens in a shape.  Never equal to a
+    # token, since tokens are ints and strs.
+    __slots__ = ()
+
+def _snapshot(play):
+    # Comparable summary of a PlayDescription.
+    return (play.is_error, play.clockmin, play.clocksec,
+            [tuple(seg.iter_set_fields()) for seg in play.segments])
+
+def _evaluate(recipe, slots):
+    kind = recipe[0]
+    if kind == 'c':
+        return recipe[1]
+    elif kind == 's':
+        return slots[recipe[1]]
+    elif kind == 'i':
+        return recipe[2] * int(slots[recipe[1]])
+    elif kind == 'j':
+        return ''.join(slots[part] if part.__class__ is int else part
+                       for part in recipe[1])
+    else:  # 't'
+        return tuple(_evaluate(r, slots) for r in recipe[1])
+
+def _split_on_slots(value, slots):
+    # Split value into literal strings and slot indices, matching the
+    # longest slot token at each position.
+    by_length = sorted(range(len(slots)), key=lambda k: -len(slots[k]))
+    parts = []
+    literal = ''
+    i = 0
+    while i < len(value):
+        for k in by_length:
+            if value.startswith(slots[k], i):
+                if literal:
+                    parts.append(literal)
+                    literal = ''
+                parts.append(k)
+                i += len(slots[k])
+                break
+        else:
+            literal += value[i]
+            i += 1
+    if literal:
+        parts.append(literal)
+    return tuple(parts)
+
+def _infer(values, runs):
+    # Return a recipe giving values[n] from the slot tokens runs[n]
+    # for every n, or None if there is none.
+    first = values[0]
+    kind = first.__class__
+    if any(v.__class__ is not kind for v in values):
+        return None
+    if all(v == first for v in values):
+        return ('c', first)
+    if kind is tuple:
+        if any(len(v) != len(first) for v in values):
+            return None
+        recipes = []
+        for i in xrange(len(first)):
+            recipe = _infer([v[i] for v in values], runs)
+            if recipe is None:
+                return None
+            recipes.append(recipe)
+        return ('t', tuple(recipes))
+    if kind is int:
+        for k, tok in enumerate(runs[0]):
+            if not tok.isdigit():
+                continue
+            for sign in (1, -1):
+                recipe = ('i', k, sign)
+                if all(_evaluate(recipe, slots) == v
+                       for v, slots in zip(values, runs)):
+                    return recipe
+        return None
+    if kind is str or kind is unicode:
+        # The perturbed runs have distinctive slot tokens to split on.
+        parts = _split_on_slots(values[1], runs[1])
+        if len(parts) == 1 and parts[0].__class__ is int:
+            recipe = ('s', parts[0])
+        else:
+            recipe = ('j', parts)
+        if all(_evaluate(recipe, slots) == v
+               for v, slots in zip(values, runs)):
+            return recipe
+    return None
+
+class _Template(object):
+    # Recipes for the results of one shape.
+    __slots__ = ('segments', 'clock')
+
+    def __init__(self, segments, clock):
+        # segments: a list, for each segment, of (field, recipe) pairs
+        # clock: recipe for (clockmin, clocksec)
+        self.segments = segments
+        self.clock = clock
+
+    def fill(self, slots):
+        play = PlayDescription()
+        play.clockmin, play.clocksec = _evaluate(self.clock, slots)
+        for recipes in self.segments:
+            seg = PlaySegment.__new__(PlaySegment)
+            for field, recipe in recipes:
+                setattr(seg, field, _evaluate(recipe, slots))
+            play.segments.append(seg)
+        return play
+
+class ShapeTemplates(object):
+    """Learns and applies per-shape templates (see the top of this
+    module).  Pass one to parse_play or parse_plays as shapes.
+    Templates describe what the parser they were learned with does,
+    so use a separate instance for each kind of parser.
+
+    Arguments:
+    ----------
+    max_shapes: number of shapes to remember.  Once reached, plays of
+    new shapes are just parsed.
+    verify: if True, check every filled-in play against the FSM.
+    seed: seed for the random slot tokens used when learning.
+
+    Set season to label the plays that follow in the coverage report.
+    """
+    def __init__(self, max_shapes=100000, verify=False, seed=0):
+        self.max_shapes = max_shapes
+        self.verify = verify
+        self.season = None
+        self._random = random.Random(seed)
+        self._templates = {}
+        self._slot_classes = {}
+        self._trie_size = None
+        self._coverage = {}
+        self.mismatches = 0
+        self.mismatch_examples = []
+
+    def __len__(self):
+        return len(self._templates)
+
+    def _literals(self):
+        # Tokens that must stay literal in shapes.  Recomputed (and
+        # everything learned forgotten) if name exceptions are added.
+        trie = parse_states._name_trie
+        if self._trie_size != len(trie):
+            self._trie_size = len(trie)
+            self._literal_set = (parse_states._literal_tokens |
+                                 parse_states._penalty_tokens |
+                                 trie.tokens())
+            self._templates.clear()
+            self._slot_classes.clear()
+        return self._literal_set
+
+    def _classify(self, tok):
+        # The slot standing for tok, or None if tok is kept literal.
+        if (tok in self._literal_set or
+            tok.lower() in parse_states._literal_lower_tokens or
+            not (_name_like.match(tok) or _number.match(tok))):
+            return None
+        return _Slot((tok.isdigit(),) +
+                     tuple(bool(t.match(tok)) for t in _token_tests))
+
+    def _slot_class(self, tok):
+        # _classify, remembered for each token seen.
+        slot = self._slot_classes.get(tok, NOT_SET)
+        if slot is NOT_SET:
+            slot = self._classify(tok)
+            if len(self._slot_classes) > 10 * self.max_shapes:
+                self._slot_classes.clear()
+            self._slot_classes[tok] = slot
+        return slot
+
+    def shape(self, tokens):
+        """Return (shape, slots) for a tuple of coded tokens: the
+        shape, and the slot tokens in order.  shape is None for plays
+        that are always parsed in full."""
+        self._literals()
+        if T_CHALLENGED in tokens:
+            return None, None
+        shape = []
+        slots = []
+        slot_class = self._slot_class
+        for tok in tokens:
+            if tok.__class__ is not int:
+                slot = slot_class(tok)
+                if slot is not None:
+                    slots.append(tok)
+                    tok = slot
+            shape.append(tok)
+        return tuple(shape), slots
+
+    def _count(self, outcome):
+        coverage = self._coverage.get(self.season)
+        if coverage is None:
+            coverage = self._coverage[self.season] = Counter()
+        coverage['plays'] += 1
+        coverage[outcome] += 1
+
+    def parse(self, play, parser):
+        """Parse play with parser (an FSM using lex_play_coded),
+        through a template where possible.  Returns the
+        PlayDescription, or raises ParseError like parser.process."""
+        stream = parser.lexer(play)
+        if not isinstance(stream, TokenStream):
+            self._count('parsed')
+            return self._run(parser, stream)
+        shape, slots = self.shape(stream.tokens)
+        template = self._templates.get(shape)
+        if template is None or template is _UNLEARNABLE:
+            self._count('parsed')
+            result = self._run(parser, stream)
+            if (template is None and shape is not None and
+                len(self._templates) < self.max_shapes):
+                self._templates[shape] = self._learn(parser, stream.tokens,
+                                                     shape, slots, result)
+            return result
+        self._count('filled')
+        result = template.fill(slots)
+        if self.verify:
+            expected = self._run(parser, TokenStream(stream.tokens))
+            if _snapshot(result) != _snapshot(expected):
+                self.mismatches += 1
+                if len(self.mismatch_examples) < 20:
+                    self.mismatch_examples.append(play)
+                return expected
+        return result
+
+    def _run(self, parser, cargo):
+        parser.process(cargo)
+        result = parser.context
+        parser.context = None
+        return result
+
+    def _perturb(self, tok, taken):
+        # A random token of the same class as tok.
+        for attempt in xrange(20):
+            chars = []
+            for c in tok:
+                if c.isupper():
+                    c = chr(self._random.randint(ord('A'), ord('Z')))
+                elif c.islower():
+                    c = chr(self._random.randint(ord('a'), ord('z')))
+                elif c.isdigit():
+                    c = chr(self._random.randint(ord('0'), ord('9')))
+                chars.append(c)
+            new = ''.join(chars)
+            if (new != tok and new not in taken and
+                self._classify(new) == self._slot_class(tok)):
+                return new
+        return None
+
+    def _learn(self, parser, tokens, shape, slots, result):
+        # Infer a _Template for shape, or return _UNLEARNABLE.
+        if result.is_error:
+            return _UNLEARNABLE
+        runs = [slots]
+        results = [result]
+        for n in xrange(2):
+            taken = set(slots)
+            perturbed = []
+            for tok in slots:
+                new = self._perturb(tok, taken)
+                if new is None:
+                    return _UNLEARNABLE
+                taken.add(new)
+                perturbed.append(new)
+            it = iter(perturbed)
+            perturbed_tokens = tuple(next(it) if s.__class__ is _Slot else s
+                                     for s in shape)
+            try:
+                perturbed_result = self._run(parser,
+                                             TokenStream(perturbed_tokens))
+            except ParseError:
+                return _UNLEARNABLE
+            if (perturbed_result.is_error or
+                len(perturbed_result.segments) != len(result.segments)):
+                return _UNLEARNABLE
+            runs.append(perturbed)
+            results.append(perturbed_result)
+        clock = _infer([(r.clockmin, r.clocksec) for r in results], runs)
+        if clock is None:
+            return _UNLEARNABLE
+        segments = []
+        for i, seg in enumerate(result.segments):
+            fields = [f for f, v in seg.iter_set_fields()]
+            recipes = []
+            for f in fields:
+                recipe = _infer([getattr(r.segments[i], f) for r in results],
+                                runs)
+                if recipe is None:
+                    return _UNLEARNABLE
+                recipes.append((f, recipe))
+            for r in results[1:]:
+                if [f for f, v in r.segments[i].iter_set_fields()] != fields:
+                    return _UNLEARNABLE
+            segments.append(recipes)
+        template = _Template(segments, clock)
+        if _snapshot(template.fill(slots)) != _snapshot(result):
+            return _UNLEARNABLE
+        return template
+
+    def report(self):
+        """Return coverage statistics as a dict:
+
+           {'shapes': <shapes seen>,
+            'templates': <shapes with a template>,
+            'mismatches': <verify failures>,
+            'seasons': {<season>: {'plays': ..., 'filled': ...,
+                                   'parsed': ..., 'coverage': ...}}}
+
+        where filled plays came from a template, parsed plays went
+        through the FSM, and coverage is the fraction filled.
+        """
+        seasons = {}
+        for season, counts in self._coverage.iteritems():
+            plays = counts['plays']
+            seasons[season] = {'plays': plays,
+                               'filled': counts['filled'],
+                               'parsed': counts['parsed'],
+                               'coverage': (float(counts['filled']) / plays
+                                            if plays else 0.0)}
+        templates = sum(1 for t in self._templates.itervalues()
+                        if t is not _UNLEARNABLE)
+        return {'shapes': len(self._templates),
+                'templates': templates,
+                'mismatches': self.mismatches,
+                'seasons': seasons}
+
+    def format_report(self):
+        """Return the report as a text table."""
+        report = self.report()
+        lines = ['%d shapes, %d with templates, %d mismatches' % (
+                report['shapes'], report['templates'], report['mismatches']),
+                 '',
+                 '%-12s %9s %9s %9s %9s' % ('season', 'plays', 'filled',
+                                            'parsed', 'coverage')]
+        for season, stats in sorted(report['seasons'].iteritems()):
+            lines.append('%-12s %9d %9d %9d %8.1f%%' % (
+                    season, stats['plays'], stats['filled'],
+                    stats['parsed'], 100 * stats['coverage']))
+        return '\n'.join(lines)
+
+    def __str__(self):
+        return self.format_report()
@@ -0,0 +1,394 @@
+############################################################
+#
+# store.py
+#
+# A binary on-disk format for built seasons, so that analysis
+# runs need not re-read and re-parse the raw csv files.
+#
+# A store is a directory of .npy files: fixed-width numeric
+# columns, dictionary-encoded string columns, and offset
+# tables giving each game's plays and each play's segments.
+# Segments are stored as the columns of a ColumnarPlays.
+#
+# SeasonStore opens the columns memory-mapped, so opening is
+# quick whatever the size, nothing is read until it is used,
+# and processes opening the same store share its pages.  Games
+# and plays are read through GameView and PlayView objects,
+# which look like Game and Play.
+#
+#   SeasonStore.write('2012.store', '2012.csv', BasicPlayMaker())
+#   store = SeasonStore('2012.store')
+#   season = Season(games=store)
+#
+############################################################
+
+import os
+import json
+import numpy as np
+from parser_types import NOT_SET
+from parse_states import parser_version
+from columnar import ColumnBuilder, ColumnarPlays
+from parser_frontend import get_play_parser, parse_play
+from builder import Play, GameFactory, iter_rows
+
+STORE_VERSION = 1
+
+# Play fields holding strings; the others are numbers.  Fields added
+# by a PlayMaker's play_class are classed by the values they hold.
+_play_category_fields = frozenset(['offense', 'type', 'end_zone_result'])
+
+# Names of other play_ columns, which play fields may not have.
+_reserved_play_fields = frozenset(['start', 'is_error', 'clockmin',
+                                   'clocksec'])
+
+def _row_mismatch(csvfile, rows, plays):
+    return ValueError('%s: %d rows, but %d plays were made' %
+                      (csvfile, rows, plays))
+
+def _is_category(field, values):
+    # Whether the values of a play_class field are strings (or else
+    # integers); raises ValueError for anything else.
+    strings = numbers = False
+    for value in values:
+        if isinstance(value, basestring):
+            strings = True
+        elif isinstance(value, (int, long)):
+            numbers = True
+        elif value is not NOT_SET and value is not None:
+            raise ValueError('cannot store %r in play field %s' %
+                             (value, field))
+    if strings and numbers:
+        raise ValueError('play field %s holds both strings and numbers' %
+                         field)
+    return strings
+
+_game_fields = ('date', 'home', 'away', 'home_points', 'away_points',
+                'winner')
+_game_category_fields = frozenset(['home', 'away', 'winner'])
+
+class _Categories(object):
+    # Dictionary encoding of the values of one string column.
+    def __init__(self):
+        self.codes = {}
+
+    def encode(self, value):
+        if value is NOT_SET or value is None:
+            return -1
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.codes)
+        return code
+
+    def values(self):
+        values = [None] * len(self.codes)
+        for value, code in self.codes.iteritems():
+            values[code] = value
+        return values
+
+def _save(dirname, name, array):
+    np.save(os.path.join(dirname, name + '.npy'), array)
+
+def _save_categories(dirname, name, values):
+    # Strings are saved as bytes: unicode strings UTF-8 encoded, and
+    # flagged in a unicode_<name> array so they load as unicode.
+    encoded = []
+    is_unicode = []
+    for value in values:
+        if isinstance(value, unicode):
+            encoded.append(value.encode('utf-8'))
+            is_unicode.append(True)
+        else:
+            encoded.append(str(value))
+            is_unicode.append(False)
+    _save(dirname, 'categories_' + name, np.array(encoded, dtype=np.string_))
+    _save(dirname, 'unicode_' + name, np.array(is_unicode, dtype=bool))
+
+def _load_categories(dirname, name):
+    encoded = np.load(os.path.join(dirname, 'categories_' + name + '.npy'))
+    is_unicode = np.load(os.path.join(dirname, 'unicode_' + name + '.npy'))
+    return tuple(v.decode('utf-8') if u else str(v)
+                 for v, u in zip(encoded, is_unicode))
+
+class SeasonStore(object):
+    """A season (or any run of games) stored by SeasonStore.write,
+    opened memory-mapped.
+
+    Iterating over the store, or indexing it, gives GameViews, in the
+    order the games were written.  segments is a ColumnarPlays
+    holding the parsed segments of every play.  play_fields are the
+    fields of the stored plays: those of the play_class of the
+    PlayMaker that wrote the store.
+    """
+    def __init__(self, dirname):
+        self.dirname = dirname
+        with open(os.path.join(dirname, 'meta.json')) as fhandle:
+            meta = json.load(fhandle)
+        if meta['store_version'] != STORE_VERSION:
+            raise ValueError('%s: unsupported store version %s' %
+                             (dirname, meta['store_version']))
+        self.parser_version = meta['parser_version']
+        self.play_fields = tuple(str(f) for f in meta['play_fields'])
+        self._play_field_set = frozenset(self.play_fields)
+        self._play_category_fields = frozenset(
+            str(f) for f in meta['play_category_fields'])
+        self.columns = {}
+        self.categories = {}
+        segment_columns = {}
+        for filename in os.listdir(dirname):
+            name, ext = os.path.splitext(filename)
+            if ext != '.npy':
+                continue
+            if name.startswith('categories_'):
+                name = name[len('categories_'):]
+                self.categories[name] = _load_categories(dirname, name)
+            elif name.startswith('unicode_'):
+                continue
+            elif name.startswith('segment_column_'):
+                segment_columns[name[len('segment_column_'):]] = \
+                    self._map(filename)
+            else:
+                self.columns[name] = self._map(filename)
+        segment_categories = dict(
+            (name[len('segment_'):], cats)
+            for name, cats in self.categories.iteritems()
+            if name.startswith('segment_'))
+        c = self.columns
+        self.segments = ColumnarPlays(
+            segment_columns, segment_categories, c['segment_play_index'],
+            c['segment_index'], c['play_is_error'], c['play_clockmin'],
+            c['play_clocksec'])
+
+    def _map(self, filename):
+        return np.load(os.path.join(self.dirname, filename), mmap_mode='r')
+
+    @classmethod
+    def write(cls, dirname, csvfile, playmaker, workers=1):
+        """Build the games in csvfile with playmaker (see GameFactory),
+        parse their descriptions, and write them all to a store in
+        dirname, which is created if needed.  Returns the opened store.
+
+        The segments are taken from the parses the playmaker keeps on
+        its plays (see PlayMaker.keep_parsed, set while writing).
+        Descriptions of plays without one, from playmakers whose
+        transform does not use PlayMaker.parse, are parsed here.
+
+        Every field of the playmaker's play_class is stored; fields it
+        adds to Play must hold strings or integers.
+        """
+        play_fields = tuple(f for f in playmaker.play_class._all_slots()
+                            if f != 'parsed')
+        reserved = _reserved_play_fields.intersection(play_fields)
+        if reserved:
+            raise ValueError('play fields clash with store columns: %s' %
+                             ', '.join(sorted(reserved)))
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        with open(csvfile, 'rb') as fhandle:
+            descriptions = [row['description'] for row in
+                            iter_rows(fhandle, ('description',))]
+        factory = GameFactory(csvfile, playmaker, workers)
+        game_columns = dict((f, []) for f in _game_fields)
+        game_categories = dict((f, _Categories())
+                               for f in _game_category_fields)
+        play_start = [0]
+        play_columns = dict((f, []) for f in play_fields)
+        segments = ColumnBuilder()
+        parser = get_play_parser(cached=True)
+        n_plays = 0
+        keep_parsed = playmaker.keep_parsed
+        playmaker.keep_parsed = True
+        try:
+            for game in factory.iter_games():
+                for f in _game_fields:
+                    value = getattr(game, f)
+                    if f in _game_category_fields:
+                        value = game_categories[f].encode(value)
+                    game_columns[f].append(value)
+                for play in game.plays:
+                    for f in play_fields:
+                        play_columns[f].append(getattr(play, f))
+                    parsed = play.parsed
+                    if parsed is NOT_SET:
+                        if n_plays >= len(descriptions):
+                            raise _row_mismatch(csvfile, len(descriptions),
+                                                n_plays + 1)
+                        parsed = parse_play(descriptions[n_plays], parser,
+                                            cache=playmaker.cache)
+                    segments.add_play(parsed)
+                    n_plays += 1
+                play_start.append(play_start[-1] + len(game.plays))
+        finally:
+            playmaker.keep_parsed = keep_parsed
+        if len(descriptions) != play_start[-1]:
+            raise _row_mismatch(csvfile, len(descriptions), play_start[-1])
+        segments = segments.finish()
+
+        for f in _game_fields:
+            _save(dirname, 'game_' + f,
+                  np.array(game_columns[f], dtype=np.int32))
+        for f, categories in game_categories.iteritems():
+            _save_categories(dirname, 'game_' + f, categories.values())
+        _save(dirname, 'play_start', np.array(play_start, dtype=np.int64))
+        play_category_fields = []
+        for f in play_fields:
+            values = play_columns.pop(f)
+            if f in Play._fields:
+                is_category = f in _play_category_fields
+            else:
+                is_category = _is_category(f, values)
+            if is_category:
+                categories = _Categories()
+                array = np.array([categories.encode(v) for v in values],
+                                 dtype=np.int32)
+                _save_categories(dirname, 'play_' + f, categories.values())
+                play_category_fields.append(f)
+            else:
+                array = np.array([np.nan if v is NOT_SET or v is None
+                                  else v for v in values],
+                                 dtype=np.float64)
+            _save(dirname, 'play_' + f, array)
+        # descriptions: one UTF-8 byte string, and the offset of each
+        descriptions = [d.encode('utf-8') if isinstance(d, unicode) else d
+                        for d in descriptions]
+        _save(dirname, 'description_data',
+              np.array(bytearray(''.join(descriptions)), dtype=np.uint8))
+        _save(dirname, 'description_start',
+              np.cumsum([0] + map(len, descriptions), dtype=np.int64))
+        # segments, and the offset of each play's first segment
+        for column, array in segments.columns.iteritems():
+            _save(dirname, 'segment_column_' + column, array)
+        for column, cats in segments.categories.iteritems():
+            _save_categories(dirname, 'segment_' + column, cats)
+        _save(dirname, 'segment_play_index', segments.play_index)
+        _save(dirname, 'segment_index', segments.segment_index)
+        _save(dirname, 'segment_start', np.searchsorted(
+                segments.play_index, np.arange(segments.n_plays + 1)))
+        _save(dirname, 'play_is_error', segments.is_error)
+        _save(dirname, 'play_clockmin', segments.clockmin)
+        _save(dirname, 'play_clocksec', segments.clocksec)
+
+        with open(os.path.join(dirname, 'meta.json'), 'w') as fhandle:
+            json.dump({'store_version': STORE_VERSION,
+                       'parser_version': parser_version(),
+                       'source': os.path.basename(csvfile),
+                       'play_fields': play_fields,
+                       'play_category_fields': play_category_fields,
+                       'games': len(play_start) - 1,
+                       'plays': play_start[-1]}, fhandle)
+        return cls(dirname)
+
+    def __len__(self):
+        return len(self.columns['play_start']) - 1
+
+    def __getitem__(self, i):
+        if not -len(self) <= i < len(self):
+            raise IndexError('game index out of range')
+        return GameView(self, i % len(self))
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield GameView(self, i)
+
+    @property
+    def n_plays(self):
+        return int(self.columns['play_start'][-1])
+
+    def _game_value(self, field, i):
+        value = self.columns['game_' + field][i]
+        if field in _game_category_fields:
+            return self.categories['game_' + field][value]
+        return int(value)
+
+    def _play_value(self, field, i):
+        value = self.columns['play_' + field][i]
+        if field in self._play_category_fields:
+            if value < 0:
+                return NOT_SET
+            return self.categories['play_' + field][value]
+        if value != value:
+            return NOT_SET
+        return int(value)
+
+    def description(self, i):
+        """Return the description of play i."""
+        start, end = self.columns['description_start'][i:i + 2]
+        return self.columns['description_data'][start:end].tostring()
+
+class GameView(object):
+    """A game in a SeasonStore, read on demand.  Has the attributes
+    of a Game; plays is a list of PlayViews."""
+    __slots__ = ('_store', 'index')
+
+    def __init__(self, store, index):
+        self._store = store
+        self.index = index
+
+    def __getattr__(self, name):
+        if name in _game_fields:
+            return self._store._game_value(name, self.index)
+        raise AttributeError(name)
+
+    @property
+    def game_id(self):
+        return '%d_%s@%s' % (self.date, self.away, self.home)
+
+    @property
+    def play_range(self):
+        """The (start, end) indexes of the game's plays in the store."""
+        start, end = self._store.columns['play_start'][
+            self.index:self.index + 2]
+        return int(start), int(end)
+
+    @property
+    def plays(self):
+        start, end = self.play_range
+        return [PlayView(self._store, i) for i in xrange(start, end)]
+
+    def __len__(self):
+        start, end = self.play_range
+        return end - start
+
+    def __repr__(self):
+        return '<GameView %s>' % self.game_id
+
+class PlayView(object):
+    """A play in a SeasonStore, read on demand.  Has the store's
+    play_fields, plus its description and the parsed segments."""
+    __slots__ = ('_store', 'index')
+
+    def __init__(self, store, index):
+        self._store = store
+        self.index = index
+
+    def __getattr__(self, name):
+        if name in self._store._play_field_set:
+            return self._store._play_value(name, self.index)
+        raise AttributeError(name)
+
+    @property
+    def description(self):
+        return self._store.description(self.index)
+
+    @property
+    def is_error(self):
+        return bool(self._store.segments.is_error[self.index])
+
+    @property
+    def segments(self):
+        """The parsed segments, as a list of PlaySegments."""
+        start, end = self._store.columns['segment_start'][
+            self.index:self.index + 2]
+        segment = self._store.segments.segment
+        return [segment(i) for i in xrange(start, end)]
+
+    def iter_set_fields(self):
+        """Generate (field, value) pairs for the play fields that
+        are set."""
+        for f in self._store.play_fields:
+            v = getattr(self, f)
+            if v is not NOT_SET:
+                yield f, v
+
+    def __repr__(self):
+        return ';'.join('{0}={1}'.format(k, v)
+                        for k, v in self.iter_set_fields())
@@ -0,0 +1,129 @@
+############################################################
+#
+# vocab.py
+#
+# Integer codes for the grammar words and punctuation that
+# the states in parse_states.py dispatch on.
+#
+# The coded lexer (lexer.lex_play_coded) replaces each of
+# these tokens with its code, and leaves everything else
+# (names, team codes, numbers, free text) as a string.  States
+# can then compare small ints instead of strings.
+#
+# Only words that can never be mistaken for part of a name,
+# a team code or a number are coded.  Ambiguous dispatch words
+# such as 'TWO' (a team code pattern), 'No' or 'Lateral' (name
+# patterns) stay strings.
+#
+############################################################
+
+T_PERIOD      = 0
+T_LPAREN      = 1
+T_RPAREN      = 2
+T_HYPHEN      = 3
+T_COLON       = 4
+T_TO          = 5
+T_AT          = 6
+T_BY          = 7
+T_ON          = 8
+T_IS          = 9
+T_AND         = 10
+T_IN          = 11
+T_OF          = 12
+T_FOR         = 13
+T_YARD        = 14
+T_YARDS       = 15
+T_PENALTY     = 16
+T_FUMBLES     = 17
+T_RECOVERED   = 18
+T_RECOVERS    = 19
+T_MUFFS       = 20
+T_CATCH       = 21
+T_KICKS       = 22
+T_PUNTS       = 23
+T_PUNT        = 24
+T_SPIKED      = 25
+T_SACKED      = 26
+T_FIELD       = 27
+T_GOAL        = 28
+T_EXTRA       = 29
+T_POINT       = 30
+T_TOUCHBACK   = 31
+T_SAFETY      = 32
+T_TOUCHDOWN   = 33
+T_TOUCHED     = 34
+T_BALL        = 35
+T_OUT         = 36
+T_BOUNDS      = 37
+T_END         = 38
+T_ZONE        = 39
+T_DECLARED    = 40
+T_DEAD        = 41
+T_FAIR        = 42
+T_DOWNED      = 43
+T_ABORTED     = 44
+T_TEAM        = 45
+T_CHALLENGED  = 46
+T_UPHELD      = 47
+T_REVERSED    = 48
+T_INCOMPLETE  = 49
+T_COMPLETE    = 50
+T_INTENDED    = 51
+T_INTERCEPTED = 52
+T_RUSHES      = 53
+T_PASS        = 54
+T_REPORTED    = 55
+T_DECLINED    = 56
+T_OFFSETTING  = 57
+T_SUPERSEDED  = 58
+T_BETWEEN     = 59
+T_DOWNS       = 60
+T_ENFORCED    = 61
+T_ATTEMPT     = 62
+T_SUCCEEDS    = 63
+T_FAILS       = 64
+
+_words = {T_PERIOD: '.', T_LPAREN: '(', T_RPAREN: ')', T_HYPHEN: '-',
+          T_COLON: ':', T_TO: 'to', T_AT: 'at', T_BY: 'by', T_ON: 'on',
+          T_IS: 'is', T_AND: 'and', T_IN: 'in', T_OF: 'of', T_FOR: 'for',
+          T_YARD: 'yard', T_YARDS: 'yards', T_PENALTY: 'PENALTY',
+          T_FUMBLES: 'fumbles', T_RECOVERED: 'recovered',
+          T_RECOVERS: 'recovers', T_MUFFS: 'muffs', T_CATCH: 'catch',
+          T_KICKS: 'kicks', T_PUNTS: 'punts', T_PUNT: 'punt',
+          T_SPIKED: 'spiked', T_SACKED: 'sacked', T_FIELD: 'field',
+          T_GOAL: 'goal', T_EXTRA: 'extra', T_POINT: 'point',
+          T_TOUCHBACK: 'touchback', T_SAFETY: 'safety',
+          T_TOUCHDOWN: 'touchdown', T_TOUCHED: 'touched', T_BALL: 'ball',
+          T_OUT: 'out', T_BOUNDS: 'bounds', T_END: 'end', T_ZONE: 'zone',
+          T_DECLARED: 'declared', T_DEAD: 'dead', T_FAIR: 'fair',
+          T_DOWNED: 'downed', T_ABORTED: 'aborted', T_TEAM: 'team',
+          T_CHALLENGED: 'challenged', T_UPHELD: 'upheld',
+          T_REVERSED: 'reversed', T_INCOMPLETE: 'incomplete',
+          T_COMPLETE: 'complete', T_INTENDED: 'intended',
+          T_INTERCEPTED: 'intercepted', T_RUSHES: 'rushes',
+          T_PASS: 'pass', T_REPORTED: 'reported', T_DECLINED: 'declined',
+          T_OFFSETTING: 'offsetting', T_SUPERSEDED: 'superseded',
+          T_BETWEEN: 'between', T_DOWNS: 'downs', T_ENFORCED: 'enforced',
+          T_ATTEMPT: 'ATTEMPT', T_SUCCEEDS: 'SUCCEEDS', T_FAILS: 'FAILS'}
+
+# code -> word, and word -> code
+words = tuple(_words[c] for c in xrange(len(_words)))
+codes = dict((w, c) for c, w in enumerate(words))
+_decode = dict(enumerate(words)).get
+
+def word(tok):
+    """Return the string form of a token, coded or not."""
+    if tok.__class__ is int:
+        return words[tok]
+    return tok
+
+def decode(tokens):
+    """Return a list of the string forms of a sequence of tokens."""
+    return map(_decode, tokens, tokens)
+
+def encode(tok):
+    """Return the code for a grammar word, or the token itself."""
+    return codes.get(tok, tok)
+
+__all__ = sorted(name for name in globals() if name.startswith('T_'))
+__all__ += ['word', 'decode', 'encode']